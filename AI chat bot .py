@@ -4,78 +4,88 @@
 # app.py – Streamlit Web Interface
 # ----------------------------
 import streamlit as st
-from PIL import Image
-import numpy as np
-from tensorflow.keras.models import load_model
-from chatbot import chatbot_response
-
-model = load_model('saved_model/brain_diagnosis_model.h5')
+from chatbot import chatbot_response, new_chat_session, stream_chatbot_response
+from batch_inference import BatchInferenceServer
+from scan_preprocessing import preprocess_images
+from scan_previews import get_preview_store
+import model_registry
+
+# Loaded and warmed up once per process, not on every Streamlit rerun.
+# SCAN_MODEL_BACKEND=int8|float16|dynamic serves a quantized TFLite export instead.
+model = model_registry.get(model_registry.scan_model_name())
 IMG_SIZE = 150
+preview_store = get_preview_store('uploads')
+
+# Concurrent uploads share one batched forward pass instead of one model.predict each
+@st.cache_resource
+def get_scan_server(backend=None):
+    scan_model = model_registry.get(model_registry.scan_model_name(backend))
+    return BatchInferenceServer(scan_model, max_batch_size=32, max_wait_ms=5)
 
-def predict_scan(img):
-    img = img.resize((IMG_SIZE, IMG_SIZE))
-    img_array = np.expand_dims(np.array(img) / 255.0, axis=0)
-    prediction = model.predict(img_array)[0][0]
+def _label(prediction):
     return 'Tumor Detected' if prediction > 0.5 else 'No Tumor Detected'
 
+# Accepts a PIL image or the raw upload bytes (bytes let JPEGs decode at reduced size)
+# `backend` picks the model for this call ('keras', 'int8', ...; default SCAN_MODEL_BACKEND)
+def predict_scan(img, backend=None):
+    img_array = preprocess_images([img], IMG_SIZE)[0]
+    return _label(get_scan_server(backend or model_registry.SCAN_MODEL_BACKEND).predict(img_array)[0])
+
+def predict_scans(images, backend=None):
+    batch = preprocess_images(images, IMG_SIZE)
+    server = get_scan_server(backend or model_registry.SCAN_MODEL_BACKEND)
+    futures = [server.submit(img_array) for img_array in batch]
+    return [_label(future.result()[0]) for future in futures]
+
 st.title("AI Mental Health Chatbot & Brain Scan Analysis")
 menu = ["Chatbot", "Brain Scan Upload"]
 choice = st.sidebar.selectbox("Select Mode", menu)
 
+with st.sidebar.expander("Model status"):
+    for name, info in model_registry.stats().items():
+        mb = (info['parameter_bytes'] or 0) / 2**20
+        st.write(f"**{name}**: loaded in {info['load_seconds']:.1f}s, {mb:.0f} MB of weights")
+        if info['rss_before_bytes'] is not None:
+            st.caption(f"RSS {info['rss_before_bytes'] / 2**20:.0f} MB → {info['rss_after_bytes'] / 2**20:.0f} MB"
+                       f"{'' if info['loaded'] else ' (unloaded while idle)'}")
+
 if choice == "Chatbot":
     st.header("Talk to AI Mental Health Assistant")
+    reply_mode = st.radio("Reply Mode", ["Supportive", "Generative (streaming)"], horizontal=True)
     user_input = st.text_input("Your Message")
     if st.button("Send"):
-        response = chatbot_response(user_input)
-        st.text_area("Chatbot:", value=response, height=100)
+        if reply_mode == "Supportive":
+            response = chatbot_response(user_input)
+            st.text_area("Chatbot:", value=response, height=100)
+        else:
+            if "chat_session" not in st.session_state:
+                st.session_state.chat_session = new_chat_session()
+            session = st.session_state.chat_session
+            placeholder = st.empty()
+            response = ""
+            for piece in stream_chatbot_response(session, user_input):
+                response += piece
+                placeholder.markdown(f"**Chatbot:** {response}")
+            metrics = session.last_metrics
+            if metrics.get("ttft_ms") is not None:
+                st.caption(f"First token in {metrics['ttft_ms']:.0f} ms · {metrics['tokens_per_sec']:.1f} tokens/sec")
 
 elif choice == "Brain Scan Upload":
     st.header("Upload MRI Brain Scan")
     uploaded_file = st.file_uploader("Choose an image", type=['jpg', 'jpeg', 'png'])
     if uploaded_file is not None:
-        image = Image.open(uploaded_file)
-        st.image(image, caption='Uploaded MRI Scan', use_column_width=True)
+        # Downscaled preview; the full-resolution upload is only decoded for analysis
+        st.image(preview_store.for_bytes(uploaded_file.getvalue()), caption='Uploaded MRI Scan', use_column_width=True)
         if st.button("Analyze"):
-            result = predict_scan(image)
+            result = predict_scan(uploaded_file.getvalue())
             st.success(f"Prediction: {result}")
 
 
 # ----------------------------
 # chatbot.py – Sentiment-Based Chatbot
 # ----------------------------
-from transformers import pipeline
-import random
-
-chatbot_pipe = pipeline('text-generation', model='gpt2')
-sentiment_pipe = pipeline('sentiment-analysis')
-
-responses = {
-    "greeting": [
-        "Hi there! How are you feeling today?",
-        "Hello! I’m here to talk if you’d like to share anything."
-    ],
-    "sad": [
-        "I'm sorry you're feeling that way. Do you want to talk about it?",
-        "It's okay to feel sad. I'm here to listen."
-    ],
-    "happy": [
-        "That’s great to hear! Keep smiling!",
-        "Wonderful! Happiness is contagious."
-    ]
-}
-
-def classify_sentiment(user_input):
-    sentiment = sentiment_pipe(user_input)[0]
-    return sentiment['label'], sentiment['score']
-
-def chatbot_response(user_input):
-    label, score = classify_sentiment(user_input)
-    if label == 'NEGATIVE':
-        return random.choice(responses['sad'])
-    elif label == 'POSITIVE':
-        return random.choice(responses['happy'])
-    else:
-        return random.choice(responses['greeting'])
+# Now a module of its own (chatbot.py, imported by the app above), so
+# benchmark.py can time the classify_sentiment / chatbot_response the app runs.
 
 
 # ----------------------------
@@ -85,6 +95,7 @@ import tensorflow as tf
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
+from preprocess_scans import SHARD_DIR, ShardedDataset, list_image_files, load_image
 import os
 
 IMG_SIZE = 150
@@ -111,16 +122,96 @@ def build_model():
     model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
     return model
 
-def train_model():
-    train_datagen = ImageDataGenerator(rescale=1./255)
-    val_datagen = ImageDataGenerator(rescale=1./255)
-    train_gen = train_datagen.flow_from_directory(train_dir, target_size=(IMG_SIZE, IMG_SIZE),
-                                                  batch_size=BATCH_SIZE, class_mode='binary')
-    val_gen = val_datagen.flow_from_directory(val_dir, target_size=(IMG_SIZE, IMG_SIZE),
-                                              batch_size=BATCH_SIZE, class_mode='binary')
+# Formats tf.io.decode_image reads; the rest of IMAGE_EXTENSIONS (.ppm, .tif,
+# .tiff) are decoded through PIL, as flow_from_directory does
+TF_DECODABLE = ('.png', '.jpg', '.jpeg', '.bmp')
+
+def _decode_image(path, label, native):
+    def tf_decode():
+        image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        image = tf.image.resize(image, (IMG_SIZE, IMG_SIZE))
+        # Cache as uint8 (4x smaller than float32); rescaling happens after the cache
+        return tf.cast(tf.round(image), tf.uint8)
+
+    def pil_decode():
+        return tf.numpy_function(lambda p: load_image(p.decode()), [path], tf.uint8)
+
+    image = tf.cond(native, tf_decode, pil_decode)
+    image.set_shape((IMG_SIZE, IMG_SIZE, 3))
+    return image, label
+
+def _rescale(images, labels):
+    return tf.cast(images, tf.float32) / 255.0, tf.cast(labels, tf.float32)
+
+# Parallel replacement for ImageDataGenerator.flow_from_directory: decodes on
+# all cores, caches decoded images after the first epoch (in memory, or on disk
+# when `cache` is a file path), reshuffles every epoch and prefetches batches
+def make_dataset(directory, training=False, cache=True, batch_size=BATCH_SIZE):
+    paths, labels, _ = list_image_files(directory)
+    native = [p.lower().endswith(TF_DECODABLE) for p in paths]
+    ds = tf.data.Dataset.from_tensor_slices((paths, labels, native))
+    ds = ds.map(_decode_image, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not training)
+    if cache:
+        ds = ds.cache(cache if isinstance(cache, str) else '')
+    if training:
+        ds = ds.shuffle(min(len(paths), 10000), reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size).map(_rescale, num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+# Batches read straight from the memory-mapped shards written by
+# preprocess_scans.py, so no epoch (or rerun) decodes a single image
+def make_shard_dataset(split, training=False, batch_size=BATCH_SIZE):
+    shards = ShardedDataset(os.path.join(SHARD_DIR, split), batch_size=batch_size, shuffle=training)
+    ds = tf.data.Dataset.from_generator(shards.batches, output_signature=(
+        tf.TensorSpec(shape=(None, IMG_SIZE, IMG_SIZE, 3), dtype=tf.float32),
+        tf.TensorSpec(shape=(None,), dtype=tf.float32)))
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+def _flow_from_directory(directory, shuffle=True):
+    datagen = ImageDataGenerator(rescale=1./255)
+    return datagen.flow_from_directory(directory, target_size=(IMG_SIZE, IMG_SIZE),
+                                       batch_size=BATCH_SIZE, class_mode='binary', shuffle=shuffle)
+
+# Images/sec of the old generator against the tf.data pipeline, cold (decoding)
+# and warm (served from the cache)
+def benchmark_input_pipeline(directory=train_dir, epochs=2):
+    import time
+
+    def images_per_sec(batches):
+        start = time.perf_counter()
+        count = sum(len(labels) for _, labels in batches)
+        return count / (time.perf_counter() - start)
+
+    gen = _flow_from_directory(directory)
+    results = {"generator": images_per_sec(gen[i] for i in range(len(gen)))}
+    ds = make_dataset(directory, training=True)
+    for epoch in range(epochs):
+        results[f"tf_data_epoch_{epoch + 1}"] = images_per_sec(ds)
+    return results
+
+def train_model(input_pipeline='tf_data'):
+    if input_pipeline == 'generator':
+        train_data = _flow_from_directory(train_dir)
+        val_data = _flow_from_directory(val_dir)
+    elif input_pipeline == 'shards':
+        train_data = make_shard_dataset('train', training=True)
+        val_data = make_shard_dataset('val')
+    else:
+        train_data = make_dataset(train_dir, training=True)
+        val_data = make_dataset(val_dir)
     model = build_model()
-    model.fit(train_gen, epochs=EPOCHS, validation_data=val_gen)
+    model.fit(train_data, epochs=EPOCHS, validation_data=val_data)
     model.save('saved_model/brain_diagnosis_model.h5')
 
 if __name__ == '__main__':
-    train_model()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Train the brain scan CNN")
+    parser.add_argument('--input-pipeline', choices=['tf_data', 'shards', 'generator'], default='tf_data')
+    parser.add_argument('--benchmark-input', action='store_true',
+                        help="compare input pipeline throughput instead of training")
+    args = parser.parse_args()
+    if args.benchmark_input:
+        for name, rate in benchmark_input_pipeline().items():
+            print(f"{name}: {rate:.1f} images/sec")
+    else:
+        train_model(args.input_pipeline)
\ No newline at end of file
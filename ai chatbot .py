@@ -1,50 +1,110 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, request, jsonify, g
 from werkzeug.utils import secure_filename
 import os
+from upload_store import HashingSpoolFile, UploadTooLarge, get_upload_store
+from scan_jobs import ScanJobQueue
 
-app = Flask(__name__)
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_MB', 50)) * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Uploaded files are streamed into a hashing, size-capped spool file inside
+# the upload folder instead of werkzeug's in-memory/tempfile buffer
+class StreamingUploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return _new_spool()
+
+def _new_spool():
+    spool = HashingSpoolFile(app.config['UPLOAD_FOLDER'], app.config['MAX_UPLOAD_BYTES'])
+    g.setdefault('spools', []).append(spool)
+    return spool
+
+app = Flask(__name__)
+app.request_class = StreamingUploadRequest
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_UPLOAD_BYTES'] = MAX_UPLOAD_BYTES
+# Rejects oversized requests from their Content-Length header before reading
+# the body; the spool file enforces the limit for chunked uploads too
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + CHUNK_SIZE
+upload_store = get_upload_store(UPLOAD_FOLDER)
+# Scan analysis runs in background worker processes; see scan_jobs.py
+jobs = ScanJobQueue()
+
+@app.errorhandler(413)
+@app.errorhandler(UploadTooLarge)
+def upload_too_large(error):
+    return jsonify({"error": f"File too large (limit {app.config['MAX_UPLOAD_BYTES'] // (1024 * 1024)} MB)"}), 413
 
+# Remove spool files of requests that failed before their upload was stored
+@app.teardown_request
+def discard_spools(exc=None):
+    for spool in g.pop('spools', []):
+        spool.discard()
+
+# Accepts multipart form uploads (field "file") or a raw request body
+# (e.g. Content-Type: application/octet-stream with ?filename=scan.png)
 @app.route('/scan', methods=['POST'])
 def scan():
-    file = request.files.get('file')
-    if not file:
-        return jsonify({"error": "No file uploaded"}), 400
+    if request.mimetype == 'multipart/form-data':
+        file = request.files.get('file')
+        if not file or not isinstance(file.stream, HashingSpoolFile):
+            return jsonify({"error": "No file uploaded"}), 400
+        spool, filename = file.stream, file.filename
+    else:
+        spool = _new_spool()
+        spool.write_from(request.stream, CHUNK_SIZE)
+        filename = request.args.get('filename', '')
+        if spool.size == 0:
+            return jsonify({"error": "No file uploaded"}), 400
+
+    stored = upload_store.put_spooled(spool, secure_filename(filename))
+    job_id = jobs.submit(stored.path, sha256=stored.digest)
 
-    filename = secure_filename(file.filename)
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    return jsonify({"message": "Scan uploaded", "job_id": job_id, "status": "queued",
+                    "status_url": f"/jobs/{job_id}", "sha256": stored.digest, "size": spool.size}), 202
 
-    # Placeholder for brain scan analysis
-    result = "Detected possible abnormality in frontal lobe."
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
 
-    return jsonify({"message": "Scan uploaded", "analysis": result})
+# One field of a finished job (?job_id=...), or the job's status while it is
+# still queued/running (202) or after it failed (500)
+def job_field(field):
+    job_id = request.args.get('job_id')
+    if not job_id:
+        return jsonify({"error": "job_id is required"}), 400
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job["status"] == "failed":
+        return jsonify({"job_id": job_id, "status": "failed", "error": job.get("error")}), 500
+    if job["status"] != "done":
+        return jsonify({"job_id": job_id, "status": job["status"]}), 202
+    return jsonify({"job_id": job_id, "status": "done", field: job[field]})
 
 @app.route('/report', methods=['GET'])
 def report():
-    # Placeholder for diagnostic report
-    report_text = "The scan shows mild abnormalities that could indicate early signs of neurological issues."
-    return jsonify({"report": report_text})
+    # Diagnostic report
+    return job_field("report")
 
 @app.route('/medical_info', methods=['GET'])
 def medical_info():
     # Medical explanation
-    info = "This condition may relate to early-stage dementia or a benign tumor."
-    return jsonify({"medical_info": info})
+    return job_field("medical_info")
 
 @app.route('/human_info', methods=['GET'])
 def human_info():
     # Human-readable explanation
-    explanation = "There might be an issue in the brain’s front part, which affects planning and decision-making."
-    return jsonify({"human_info": explanation})
+    return job_field("human_info")
 
 @app.route('/result', methods=['GET'])
 def result():
     # Final result
-    final_result = "We recommend consulting a neurologist for further examination."
-    return jsonify({"result": final_result})
+    return job_field("result")
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
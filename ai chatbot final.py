@@ -1,7 +1,9 @@
 import streamlit as st
 import os
 from datetime import date
-import plotly.graph_objects as go
+from upload_store import get_upload_store
+from scan_previews import get_preview_store
+from brain_mesh import BRAIN_MESH_PATH, DEFAULT_LOD, LOD_LEVELS, mesh_figure
 
 # Hardcoded credentials (for demo)
 USERNAME = "admin"
@@ -10,6 +12,8 @@ PASSWORD = "brain123"
 # Set upload directory
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+upload_store = get_upload_store(UPLOAD_FOLDER)
+preview_store = get_preview_store(UPLOAD_FOLDER)
 
 # Session state for login
 if "logged_in" not in st.session_state:
@@ -51,13 +55,12 @@ st.header("📤 Upload Brain Scan")
 uploaded_file = st.file_uploader("Upload a brain scan image (e.g., MRI, CT)", type=["png", "jpg", "jpeg"])
 
 if uploaded_file is not None:
-    filename = uploaded_file.name
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
-    with open(filepath, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+    # Stored once per unique scan; reruns and re-uploads do not rewrite it
+    stored = upload_store.put_uploaded_file(uploaded_file, patient=patient_name)
 
     st.success("✅ Scan uploaded successfully!")
-    st.image(filepath, caption="Uploaded Brain Scan", use_column_width=True)
+    # Downscaled preview, made once per unique scan
+    st.image(preview_store.for_upload(stored), caption="Uploaded Brain Scan", use_column_width=True)
 
     st.markdown("---")
     st.subheader("🧠 Analysis Result")
@@ -104,25 +107,10 @@ if uploaded_file is not None:
     st.subheader("✅ Final Suggestion")
     st.success("Based on the scan, it's recommended to consult a neurologist for further evaluation.")
 
-    # 3D Brain Model Viewer
-    st.subheader("🧠 3D Brain Model Viewer (Illustrative)")
-    fig = go.Figure(data=go.Mesh3d(
-        x=[0, 0, 1, 1, 0, 0, 1, 1],
-        y=[0, 1, 1, 0, 0, 1, 1, 0],
-        z=[0, 0, 0, 0, 1, 1, 1, 1],
-        i=[0, 0, 0, 1, 1, 2, 2, 3, 4, 4, 5, 6],
-        j=[1, 2, 3, 2, 3, 3, 0, 0, 5, 6, 6, 7],
-        k=[2, 3, 0, 3, 0, 0, 1, 1, 6, 7, 7, 4],
-        color='lightblue',
-        opacity=0.5,
-    ))
-    fig.update_layout(
-        margin=dict(l=0, r=0, b=0, t=0),
-        scene=dict(
-            xaxis_title='X',
-            yaxis_title='Y',
-            zaxis_title='Z',
-            aspectratio=dict(x=1, y=1, z=1)
-        )
-    )
-    st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
+    # 3D Brain Model Viewer: decimated levels of detail, parsed and serialized once per mesh
+    st.subheader("🧠 3D Brain Model Viewer")
+    if os.path.exists(BRAIN_MESH_PATH):
+        detail = st.select_slider("Level of detail", options=list(LOD_LEVELS), value=DEFAULT_LOD)
+        st.plotly_chart(mesh_figure(BRAIN_MESH_PATH, detail), use_container_width=True)
+    else:
+        st.info(f"No brain mesh found at {BRAIN_MESH_PATH} (OBJ, PLY or STL; set BRAIN_MESH_PATH).")
\ No newline at end of file
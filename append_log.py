@@ -0,0 +1,90 @@
+# ----------------------------
+# append_log.py – Shared Helpers for Append-Only Line Files
+# ----------------------------
+# users.txt, the patient history, the encrypted per-user histories and the
+# upload index are append-only files of one record per line, written by
+# several app workers at once and indexed in memory by each of them:
+#   file_lock / locked_append   appends under an exclusive flock, whole lines only
+#   FileTail                    the complete lines appended since the last read
+#   PerProcess                  one index object per file per process, so it
+#                               survives Streamlit reruns
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process locks only
+    fcntl = None
+
+
+# Exclusive lock on an open file for the duration of the block
+@contextmanager
+def file_lock(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+    try:
+        yield f
+    finally:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def locked_append(path, text, fsync=False):
+    with open(path, "a", encoding="utf-8") as f, file_lock(f):
+        f.write(text)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+
+
+# Follows a file by inode/mtime/size, so an unchanged file costs one stat()
+class FileTail:
+    def __init__(self, path):
+        self.path = path
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self._stat_key = None
+
+    # (data, start, restarted): the complete lines appended since the last
+    # call and the file offset they start at. A writer may be mid-line; the
+    # partial line is left for the next call. restarted is True when the file
+    # was replaced, truncated or removed: data then holds the whole file and
+    # the caller must drop whatever it indexed before.
+    def read_new(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self.reset()
+            return b"", 0, True
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if key == self._stat_key:
+            return b"", self.offset, False
+        restarted = self._stat_key is None or stat.st_ino != self._stat_key[0] or stat.st_size < self.offset
+        if restarted:
+            self.reset()
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        start = self.offset
+        self.offset += end
+        self._stat_key = key
+        return data[:end], start, restarted
+
+
+# One instance per key per process, built by factory(*args) on first use
+class PerProcess:
+    def __init__(self, factory):
+        self._factory = factory
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, *args, **kwargs):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                item = self._items[key] = self._factory(*args, **kwargs)
+            return item
@@ -0,0 +1,162 @@
+# ----------------------------
+# batch_inference.py – Dynamic Micro-Batching Inference Server
+# ----------------------------
+# Concurrent callers submit single preprocessed scans; a background thread
+# merges whatever has queued up (bounded by max_batch_size / max_wait_ms)
+# into one forward pass and hands each caller its own row via a Future.
+# Every input must have the same shape and dtype (input_shape / dtype, or
+# those of the first input accepted): a mismatched one is rejected in
+# submit() instead of failing the whole batch it would have joined.
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 5
+
+
+class BatchInferenceServer:
+    def __init__(self, model, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 predict_fn=None, input_shape=None, dtype=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        # predict_on_batch skips the per-call setup that model.predict does
+        self.predict_fn = predict_fn or model.predict_on_batch
+        self.input_shape = tuple(input_shape) if input_shape is not None else None
+        self.dtype = np.dtype(dtype) if dtype is not None else None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        # Guards _closed, the expected input and enqueueing against close()
+        self._submit_lock = threading.Lock()
+        self._stats = {"requests": 0, "batches": 0, "max_batch": 0, "busy_seconds": 0.0}
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="batch-inference", daemon=True)
+        self._worker.start()
+
+    # Queue one input (shape without the batch axis) and return a Future for its prediction
+    def submit(self, x):
+        x = np.asarray(x)
+        future = Future()
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError("BatchInferenceServer is closed")
+            if self.input_shape is None:
+                self.input_shape = x.shape
+            if self.dtype is None:
+                self.dtype = x.dtype
+            if x.shape != self.input_shape or x.dtype != self.dtype:
+                raise ValueError(f"Expected an input of shape {self.input_shape} and dtype {self.dtype}, "
+                                 f"got {x.shape} {x.dtype}")
+            self._queue.put((x, future))
+        return future
+
+    # Blocking convenience wrapper around submit()
+    def predict(self, x, timeout=None):
+        return self.submit(x).result(timeout=timeout)
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Re-queue the shutdown sentinel so the loop exits after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                return
+            # Drop requests whose callers cancelled while queued
+            live = [(x, f) for x, f in batch if f.set_running_or_notify_cancel()]
+            if not live:
+                continue
+            inputs = [x for x, _ in live]
+            futures = [f for _, f in live]
+            start = time.perf_counter()
+            try:
+                outputs = np.asarray(self.predict_fn(np.stack(inputs)))
+            except Exception as exc:
+                for f in futures:
+                    f.set_exception(exc)
+                continue
+            for f, out in zip(futures, outputs):
+                f.set_result(out)
+            with self._lock:
+                self._stats["requests"] += len(futures)
+                self._stats["batches"] += 1
+                self._stats["max_batch"] = max(self._stats["max_batch"], len(futures))
+                self._stats["busy_seconds"] += time.perf_counter() - start
+
+    # Queue depth plus request/batch counters, for dashboards and tuning
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["avg_batch"] = stats["requests"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    # Stop accepting work; already queued requests are still served
+    def close(self, timeout=None):
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._worker.join(timeout)
+
+
+# Compare one-at-a-time predict_on_batch calls against the batching server
+# under `concurrency` simultaneous callers; reports images/sec and p99 latency
+def benchmark(model, sample, n_requests=256, concurrency=16, **server_kwargs):
+    def run(call):
+        latencies = []
+
+        def one(_):
+            start = time.perf_counter()
+            call(sample)
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(n_requests)))
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        return {
+            "images_per_sec": n_requests / elapsed,
+            "p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1000,
+        }
+
+    sample = np.asarray(sample)
+    single_lock = threading.Lock()
+
+    def single(x):
+        # Keras models are not safe to call from many threads at once
+        with single_lock:
+            return model.predict_on_batch(x[np.newaxis])
+
+    results = {"single": run(single)}
+    server = BatchInferenceServer(model, **server_kwargs)
+    try:
+        results["batched"] = run(server.predict)
+        results["batched"]["avg_batch"] = server.stats()["avg_batch"]
+    finally:
+        server.close()
+    return results
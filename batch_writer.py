@@ -0,0 +1,252 @@
+# ----------------------------
+# batch_writer.py – Buffered Group-Commit Appender
+# ----------------------------
+# Callers hand lines to a background thread instead of opening, appending to
+# and closing the file for every record. The thread writes whatever has
+# queued up in one locked write (optionally followed by one fsync for the
+# whole group), and everything still queued is flushed when the process exits.
+# One writer can serve several files (e.g. one history file per user); each
+# group is then written with one locked write per file it touches.
+# Writers survive fork() (serve.py forks after the app created them): the
+# parent drains its queues first and each child starts fresh threads.
+# write() returns a Future that resolves once the line is on disk. Lines that
+# cannot be written are kept and retried, and saved under SPOOL_DIR if they
+# still fail when the process exits.
+import atexit
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import quote
+
+from append_log import locked_append
+
+DEFAULT_MAX_BATCH = 256
+DEFAULT_MAX_DELAY_MS = 20
+# Upper bound on how long exit waits for a writer that keeps failing
+SHUTDOWN_TIMEOUT = 10
+# A path that still fails after this many retries is set aside and retried
+# every RETRY_INTERVAL seconds, so one unwritable file cannot stall every
+# other file behind it
+WRITE_RETRIES = 3
+RETRY_INTERVAL = 5.0
+SPOOL_DIR = os.environ.get("WRITE_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "group-commit-spool"))
+
+log = logging.getLogger(__name__)
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+class GroupCommitWriter:
+    def __init__(self, path=None, max_batch=DEFAULT_MAX_BATCH, max_delay_ms=DEFAULT_MAX_DELAY_MS, fsync=False):
+        self.path = path
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000.0
+        self.fsync = fsync
+        self._stats = {"records": 0, "flushes": 0, "last_flush_ms": 0.0, "max_flush_ms": 0.0, "total_flush_ms": 0.0,
+                       "pending_records": 0, "spooled_records": 0, "last_error": None}
+        self._closed = False
+        self._start()
+
+    # Fresh queue, lock and background thread (also used in a forked child,
+    # where the parent's thread does not exist and its locks may be held)
+    def _start(self):
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        # path -> [(line, future)] that failed and wait for the next retry
+        self._held = {}
+        self._next_retry = 0.0
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+
+    # Queue one line for `path` (default: the writer's own file); returns
+    # immediately with a Future that resolves to True once the line is on disk,
+    # or fails with the write error (the line is then kept and retried).
+    # A trailing newline is added if missing.
+    def write(self, line, path=None):
+        path = path or self.path
+        if path is None:
+            raise ValueError("No path given for this write")
+        if self._closed:
+            raise RuntimeError("Writer is closed")
+        future = Future()
+        self._queue.put((path, line if line.endswith("\n") else line + "\n", future))
+        return future
+
+    # Block until every line queued before this call is on disk
+    def flush(self, timeout=None):
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _next_group(self):
+        try:
+            item = self._queue.get(timeout=RETRY_INTERVAL if self._held else None)
+        except queue.Empty:
+            return []
+        group = [item]
+        deadline = time.perf_counter() + self.max_delay
+        while item is not None and not isinstance(item, threading.Event) and len(group) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            group.append(item)
+        return group
+
+    # One locked append of `lines`; returns the last error, or None on success
+    def _append(self, path, lines, attempts):
+        for attempt in range(attempts):
+            try:
+                locked_append(path, "".join(lines), self.fsync)
+                return None
+            except Exception as exc:
+                error = exc
+                if attempt + 1 < attempts:
+                    time.sleep(max(self.max_delay, 0.1) * (attempt + 1))
+        return error
+
+    # Write each path's lines (held lines first, to keep their order). A path
+    # that fails after its retries is held, its futures fail, and the other
+    # paths are written either way.
+    def _commit(self, records):
+        start = time.perf_counter()
+        new = {}
+        for path, line, future in records:
+            new.setdefault(path, []).append((line, future))
+        retry_held = time.monotonic() >= self._next_retry
+        by_path = {path: self._held.pop(path) for path in list(self._held) if retry_held or path in new}
+        held_paths = set(by_path)
+        for path, entries in new.items():
+            by_path.setdefault(path, []).extend(entries)
+        if not by_path:
+            return
+        written = 0
+        last_error = None
+        for path, entries in by_path.items():
+            # A path known to fail gets one attempt per round, not the full backoff
+            attempts = 1 if path in held_paths else WRITE_RETRIES + 1
+            error = self._append(path, [line for line, _ in entries], attempts)
+            if error is None:
+                written += len(entries)
+                for _, future in entries:
+                    if not future.done():
+                        future.set_result(True)
+                continue
+            log.error("Could not write %d record(s) to %s, keeping them for a retry: %s", len(entries), path, error)
+            self._held[path] = entries
+            last_error = f"{path}: {type(error).__name__}: {error}"
+            for _, future in entries:
+                if not future.done():
+                    future.set_exception(error)
+        if last_error:
+            self._next_retry = time.monotonic() + RETRY_INTERVAL
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self._stats["pending_records"] = sum(len(entries) for entries in self._held.values())
+            if last_error:
+                self._stats["last_error"] = last_error
+            self._stats["records"] += written
+            self._stats["flushes"] += 1
+            self._stats["last_flush_ms"] = elapsed_ms
+            self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], elapsed_ms)
+            self._stats["total_flush_ms"] += elapsed_ms
+
+    # Last chance at exit: held lines get one more attempt, and whatever still
+    # fails is appended to a file under SPOOL_DIR named after the target path
+    def _spool_held(self):
+        for path, entries in self._held.items():
+            lines = [line for line, _ in entries]
+            if self._append(path, lines, 1) is None:
+                continue
+            spool = os.path.join(SPOOL_DIR, quote(os.path.abspath(path), safe="") + ".pending")
+            try:
+                os.makedirs(SPOOL_DIR, exist_ok=True)
+                locked_append(spool, "".join(lines), fsync=True)
+                log.error("Saved %d unwritten record(s) for %s to %s", len(lines), path, spool)
+                with self._stats_lock:
+                    self._stats["spooled_records"] += len(lines)
+            except Exception:
+                log.exception("Lost %d record(s) for %s", len(lines), path)
+        self._held.clear()
+        with self._stats_lock:
+            self._stats["pending_records"] = 0
+
+    def _run(self):
+        while True:
+            group = self._next_group()
+            records = [item for item in group if isinstance(item, tuple)]
+            if records or self._held:
+                try:
+                    self._commit(records)
+                except Exception:
+                    # Never let the writer thread die: later writes and flushes depend on it
+                    log.exception("Group commit failed")
+            # Flushes are released even if some records could not be written
+            for item in group:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if group and group[-1] is None:
+                self._spool_held()
+                return
+
+    # Queue depth and flush latency, for dashboards
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["avg_flush_ms"] = stats["total_flush_ms"] / stats["flushes"] if stats["flushes"] else 0.0
+        stats["avg_batch"] = stats["records"] / stats["flushes"] if stats["flushes"] else 0.0
+        return stats
+
+    # Write out everything still queued and stop the background thread
+    def close(self, timeout=None):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+
+# One writer per file (or per name, for writers that serve several files) per
+# process, so every caller shares the same queue and background thread
+def get_writer(path=None, name=None, **kwargs):
+    key = name or os.path.abspath(path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = GroupCommitWriter(path, **kwargs)
+        return writer
+
+
+@atexit.register
+def close_all():
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close(timeout=SHUTDOWN_TIMEOUT)
+
+
+def _before_fork():
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        if not writer._closed:
+            writer.flush(timeout=SHUTDOWN_TIMEOUT)
+
+
+def _after_fork_in_child():
+    global _writers_lock
+    _writers_lock = threading.Lock()
+    for writer in _writers.values():
+        if not writer._closed:
+            writer._start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_before_fork, after_in_child=_after_fork_in_child)
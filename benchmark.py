@@ -0,0 +1,617 @@
+# ----------------------------
+# benchmark.py – Benchmark Suite for the Apps' Hot Paths
+# ----------------------------
+# Times the code behind predict_scan, classify_sentiment / chatbot_response,
+# loading users and authenticate_user at 10k-1M accounts, get_history at 10k
+# records, create_pdf and upload writes, and /scan throughput of serve.py at
+# 1, 2 and 4 workers (the "serving" case, which starts real servers). All
+# inputs are synthetic, generated from fixed seeds in a scratch directory.
+# The Streamlit apps draw their UI when imported, so each case calls the
+# modules those apps import (chatbot.py for the sentiment cases) or the
+# functions their app functions are built from. Every case runs once to warm up and then
+# --repeat timed rounds; the median round is the figure that is compared.
+#
+# Results are saved as benchmark_results/<commit>.json. With --baseline the
+# run is compared against the saved result of an earlier commit, and a case
+# that got slower by more than --threshold is flagged as a regression (exit
+# status 1, so CI can fail on it).
+#
+#   python benchmark.py run [--quick] [--only users,history] [--baseline main]
+#   python benchmark.py compare benchmark_results/<old>.json benchmark_results/<new>.json
+import argparse
+import gc
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from importlib import metadata
+
+import numpy as np
+
+RESULTS_DIR = 'benchmark_results'
+SEED = 1234
+DEFAULT_REPEAT = 5
+USER_COUNTS = (10_000, 100_000, 1_000_000)
+HISTORY_RECORDS = 10_000
+# A case is a regression when its median is this much slower than the baseline...
+DEFAULT_THRESHOLD = 0.10
+# ...and by more than this many seconds (sub-millisecond jitter is not a regression)
+MIN_DELTA_SECONDS = 0.0005
+# serve.py worker counts for the serving case (workers beyond the cores are skipped)
+SERVING_WORKERS = (1, 2, 4)
+SERVING_SCANS = 32
+SERVE_START_TIMEOUT = 180
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+VERSIONED_PACKAGES = ('numpy', 'pillow', 'tensorflow', 'torch', 'transformers', 'fpdf2', 'cryptography')
+
+
+# Reason a case could not run (missing model, package or download)
+class Skip(Exception):
+    pass
+
+
+class Suite:
+    def __init__(self, workdir, repeat=DEFAULT_REPEAT, quick=False):
+        self.workdir = workdir
+        self.repeat = repeat
+        self.quick = quick
+        self.results = {}
+        self.skipped = {}
+
+    # Time fn (called with setup()'s return value, if there is a setup) and
+    # record the median, min and max of the rounds under name[param=value,...]
+    def measure(self, name, fn, items=1, repeat=None, setup=None, **params):
+        key = name + (f"[{','.join(f'{k}={v}' for k, v in params.items())}]" if params else "")
+        times = []
+        for round_ in range(1 + (repeat or self.repeat)):
+            arg = setup() if setup else None
+            gc.collect()
+            start = time.perf_counter()
+            fn(arg) if setup else fn()
+            elapsed = time.perf_counter() - start
+            if round_:
+                times.append(elapsed)
+        median = statistics.median(times)
+        self.results[key] = {
+            "median_s": median, "min_s": min(times), "max_s": max(times), "rounds": len(times),
+            "items": items, "ms_per_item": median * 1000 / items, "items_per_sec": items / median if median else None,
+            "params": params,
+        }
+        print(f"  {key:<48} {median * 1000:10.2f} ms  ({median * 1000 / items:.3f} ms/item)")
+        return self.results[key]
+
+    def path(self, *parts):
+        path = os.path.join(self.workdir, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+
+# ----------------------------
+# Synthetic data
+# ----------------------------
+# Grey MRI-like slices: a noisy ellipse with a brighter blob in some of them, as JPEG bytes
+def synthetic_scans(n, size=512, seed=SEED):
+    from PIL import Image, ImageDraw, ImageFilter
+    rng = np.random.default_rng(seed)
+    scans = []
+    for i in range(n):
+        img = Image.new('L', (size, size))
+        draw = ImageDraw.Draw(img)
+        draw.ellipse([size * 0.15, size * 0.1, size * 0.85, size * 0.9], fill=int(rng.integers(90, 140)))
+        if i % 2:
+            x, y, r = rng.integers(size // 3, 2 * size // 3, 2).tolist() + [int(rng.integers(size // 20, size // 8))]
+            draw.ellipse([x - r, y - r, x + r, y + r], fill=220)
+        pixels = np.asarray(img.filter(ImageFilter.GaussianBlur(3)), dtype=np.int16)
+        pixels = np.clip(pixels + rng.normal(0, 12, pixels.shape), 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+        scans.append(buffer.getvalue())
+    return scans
+
+
+_FEELINGS = ["sad", "happy", "anxious", "tired", "great", "lonely", "hopeful", "stressed", "calm", "angry"]
+_TEMPLATES = [
+    "I feel {f} today",
+    "hi",
+    "Honestly I have been {f} all week and I don't know why",
+    "My exams are next week and I am {f}",
+    "thanks, that helps",
+    "I couldn't sleep last night, I'm so {f}",
+    "Work has been {f} lately but my friends keep me going",
+]
+
+
+# Chat messages of mixed length; about a third repeat earlier ones (as real traffic does)
+def synthetic_messages(n, seed=SEED):
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(n):
+        if messages and rng.random() < 0.3:
+            messages.append(rng.choice(messages))
+        else:
+            messages.append(rng.choice(_TEMPLATES).format(f=rng.choice(_FEELINGS)))
+    return messages
+
+
+# History records shaped like the ones "final bot 3.py" saves
+def synthetic_records(n, seed=SEED):
+    rng = random.Random(seed)
+    start = date(2020, 1, 1)
+    return [{
+        "Patient Name": f"Patient {rng.randrange(n // 10 + 1):05d}",
+        "Age": rng.randint(1, 99),
+        "Scan Date": str(start + timedelta(days=rng.randrange(2000))),
+        "Scan Type": rng.choice(["MRI", "CT", "PET"]),
+        "Physician": f"Dr. {rng.choice(['Rao', 'Smith', 'Okafor', 'Chen', 'Garcia'])}",
+        "Diagnosis": rng.choice(["No abnormality detected.", "Possible abnormality detected in the frontal lobe."]),
+        "Timestamp": datetime(2024, 1, 1, 9, 0).strftime("%Y-%m-%d %H:%M:%S"),
+    } for _ in range(n)]
+
+
+# A users file with n accounts. They share one stored hash: computing a
+# million KDF hashes would take hours, and lookups do not depend on the value.
+def write_users_file(path, n, stored, sep=","):
+    with open(path, "w", encoding="utf-8") as f:
+        for start in range(0, n, 10_000):
+            f.write("".join(f"user{i:07d}{sep}{stored}\n" for i in range(start, min(start + 10_000, n))))
+
+
+# ----------------------------
+# Cases
+# ----------------------------
+def bench_scan(suite):
+    import model_registry
+    from batch_inference import BatchInferenceServer
+    from scan_preprocessing import preprocess_images
+
+    scans = synthetic_scans(32)
+    suite.measure("predict_scan.preprocess", lambda: [preprocess_images([s]) for s in scans], items=len(scans))
+    backends = ['keras'] + [mode for mode, path in model_registry.TFLITE_MODEL_PATHS.items() if os.path.exists(path)]
+    if not os.path.exists(model_registry.BRAIN_MODEL_PATH):
+        backends.remove('keras')
+    if not backends:
+        raise Skip(f"no scan model at {model_registry.BRAIN_MODEL_PATH} and no TFLite export")
+    for backend in backends:
+        model = model_registry.get(model_registry.scan_model_name(backend))
+        server = BatchInferenceServer(model, max_batch_size=32, max_wait_ms=5)
+        try:
+            # predict_scan: one upload at a time
+            suite.measure("predict_scan", lambda: [server.predict(preprocess_images([s])[0]) for s in scans],
+                          items=len(scans), backend=backend)
+            # predict_scans: a batch of uploads submitted together
+            suite.measure("predict_scans", lambda: [f.result() for f in map(server.submit, preprocess_images(scans))],
+                          items=len(scans), backend=backend)
+        finally:
+            server.close()
+
+
+def bench_sentiment(suite):
+    try:
+        import chatbot
+    except Exception as exc:  # transformers missing, or the model cannot be downloaded
+        raise Skip(f"sentiment model unavailable: {type(exc).__name__}: {exc}")
+    messages = synthetic_messages(64)
+    unique = list(dict.fromkeys(messages))
+    clear = chatbot.sentiment_cache.clear
+
+    # classify_sentiment / chatbot_response on a cache miss and on a hit
+    suite.measure("classify_sentiment.uncached", lambda cleared: [chatbot.classify_sentiment(m) for m in unique],
+                  items=len(unique), setup=clear)
+    suite.measure("classify_sentiment.cached", lambda: [chatbot.classify_sentiment(m) for m in messages],
+                  items=len(messages))
+    suite.measure("chatbot_response", lambda cleared: [chatbot.chatbot_response(m) for m in messages],
+                  items=len(messages), setup=clear)
+    # The batch variants: cache lookups, then length-sorted buckets of BUCKET_SIZE
+    suite.measure("classify_sentiment_batch", lambda cleared: chatbot.classify_sentiment_batch(unique),
+                  items=len(unique), setup=clear)
+    suite.measure("chatbot_response_batch", lambda cleared: chatbot.chatbot_response_batch(messages),
+                  items=len(messages), setup=clear)
+
+
+def bench_users(suite):
+    import credentials
+    from user_store import UserStore
+
+    password = "correct horse battery staple"
+    stored = credentials.hash_password(password)
+    rng = random.Random(SEED)
+    for n in USER_COUNTS[:1] if suite.quick else USER_COUNTS:
+        path = suite.path("users", f"users_{n}.txt")
+        write_users_file(path, n, stored)
+        # load_users: a new worker parses the whole file
+        suite.measure("load_users", lambda: len(UserStore(path, ",")), users=n)
+        store = UserStore(path, ",")
+        len(store)
+        names = [f"user{rng.randrange(n):07d}" for _ in range(10_000)]
+        suite.measure("user_lookup", lambda: [store.get(name) for name in names], items=len(names), users=n)
+        # authenticate_user: dominated by the KDF, so it should not grow with n
+        logins = names[:5]
+        suite.measure("authenticate_user", lambda: [credentials.authenticate(store, name, password) for name in logins],
+                      items=len(logins), repeat=3, users=n)
+
+
+def bench_history(suite):
+    from cryptography.fernet import Fernet
+
+    from batch_writer import GroupCommitWriter
+    from encrypted_history import EncryptedHistoryCache, encode_record
+    from patient_history import PatientHistory
+
+    n = HISTORY_RECORDS
+    records = synthetic_records(n)
+    fernet = Fernet(Fernet.generate_key())
+    path = suite.path("history", "bench_history.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(fernet.encrypt(encode_record(r).encode()).decode() + "\n" for r in records)
+
+    # get_history on a new session: index the file and show the first page
+    def first_page():
+        cache = EncryptedHistoryCache(path, fernet)
+        cache.refresh()
+        return cache.page(0, 10)
+
+    suite.measure("get_history.first_page", first_page, records=n)
+    warm = EncryptedHistoryCache(path, fernet)
+    warm.refresh()
+    warm.page(0, 10)
+    # get_history on a rerun of the same session
+    suite.measure("get_history.rerun", lambda: (warm.refresh(), warm.page(0, 10)), records=n)
+
+    def all_records():
+        cache = EncryptedHistoryCache(path, fernet)
+        cache.refresh()
+        return cache.records()
+
+    suite.measure("get_history.all_records", all_records, items=n, repeat=3, records=n)
+
+    # save_history: encrypt and queue through the group-commit writer, then wait for the fsyncs
+    save_path = suite.path("history", "save_history.txt")
+    writer = GroupCommitWriter(save_path, fsync=True)
+    batch = records[:1000]
+
+    def save():
+        for r in batch:
+            writer.write(fernet.encrypt(encode_record(r).encode()).decode())
+        writer.flush()
+
+    try:
+        suite.measure("save_history", save, items=len(batch), repeat=3)
+    finally:
+        writer.close()
+
+    # patient_history (final bot / final bot 2): index build, filtered query and one page
+    patient_path = suite.path("history", "patient_history.jsonl")
+    history = PatientHistory(patient_path, fsync=False)
+    history.extend([{"name": r["Patient Name"], "age": r["Age"], "scan_date": r["Scan Date"],
+                     "scan_type": r["Scan Type"], "physician": r["Physician"], "result": r["Diagnosis"]}
+                    for r in records])
+
+    def patient_query():
+        fresh = PatientHistory(patient_path, fsync=False)
+        rows = fresh.query(scan_type="MRI", date_from="2022-01-01")
+        return fresh.page(rows, 0)
+
+    suite.measure("patient_history.query", patient_query, records=n)
+
+
+def bench_pdf(suite):
+    import pdf_reports
+
+    records = synthetic_records(20)
+    reports = [pdf_reports.report_from_history(r) for r in records]
+    suite.measure("create_pdf.render", lambda: [pdf_reports.render_report(*r) for r in reports], items=len(reports))
+    out = suite.path("reports", "report.pdf")
+    suite.measure("create_pdf", lambda: [pdf_reports.create_pdf(data, diagnosis, out) for data, diagnosis in reports],
+                  items=len(reports))
+    [pdf_reports.cached_report(*r) for r in reports]
+    suite.measure("cached_report.hit", lambda: [pdf_reports.cached_report(*r) for r in reports], items=len(reports))
+
+
+def bench_uploads(suite):
+    from batch_writer import get_writer
+    from upload_store import HashingSpoolFile, UploadStore
+
+    scans = synthetic_scans(16, size=1024)
+    rounds = iter(range(1_000_000))
+
+    # A fresh store per round, so every blob is new
+    def new_store():
+        return UploadStore(os.path.join(suite.workdir, f"uploads_{next(rounds)}"))
+
+    def put_all(store):
+        for i, data in enumerate(scans):
+            store.put(data, f"scan_{i}.jpg", patient="bench")
+        get_writer(store.index_path).flush()
+
+    suite.measure("upload.put.new", put_all, items=len(scans), setup=new_store)
+    store = new_store()
+    put_all(store)
+    # Re-uploads of blobs that are already stored: hashing only
+    suite.measure("upload.put.duplicate", lambda: put_all(store), items=len(scans))
+
+    # The Flask API's streamed path: spool in 64 KiB chunks, then move into the store
+    def put_spooled(store):
+        for i, data in enumerate(scans):
+            spool = HashingSpoolFile(store.root, 50 * 1024 * 1024)
+            spool.write_from(io.BytesIO(data))
+            store.put_spooled(spool, f"scan_{i}.jpg", patient="bench")
+        get_writer(store.index_path).flush()
+
+    suite.measure("upload.put_spooled.new", put_spooled, items=len(scans), setup=new_store)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# serve.py with the repo's serving.ini, except for the worker count and port,
+# in its own directory (uploads/ and jobs/ land there; saved_model/ is linked)
+def _start_server(suite, workers):
+    import serving_config
+
+    workdir = os.path.dirname(suite.path(f"serve_{workers}", "serving.ini"))
+    config = serving_config.load_config(os.path.join(REPO_DIR, serving_config.DEFAULT_CONFIG_PATH))
+    config.set('serving', 'app', os.path.join(REPO_DIR, config.get('serving', 'app')))
+    config.set('serving', 'workers', str(workers))
+    config.set('serving', 'port', str(_free_port()))
+    config_path = os.path.join(workdir, "serving.ini")
+    with open(config_path, "w", encoding="utf-8") as f:
+        config.write(f)
+    models = os.path.join(REPO_DIR, 'saved_model')
+    if os.path.isdir(models):
+        os.symlink(models, os.path.join(workdir, 'saved_model'))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get('PYTHONPATH')])))
+    env.pop('SERVING_CONFIG', None)
+    log_path = os.path.join(workdir, "serve.log")
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, 'serve.py'), '--config', config_path],
+                                cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base = f"http://127.0.0.1:{config.getint('serving', 'port')}"
+    deadline = time.monotonic() + SERVE_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            with open(log_path, encoding="utf-8", errors="replace") as f:
+                raise Skip(f"serve.py exited with status {proc.returncode}: {f.read()[-500:]}")
+        try:
+            socket.create_connection(('127.0.0.1', config.getint('serving', 'port')), timeout=1).close()
+            return proc, base
+        except OSError:
+            time.sleep(0.2)
+    _stop_server(proc)
+    raise Skip(f"serve.py did not start listening within {SERVE_START_TIMEOUT}s")
+
+
+def _stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+# POST one scan to /scan and poll /jobs/<id> until the job has finished
+def _scan_over_http(base, data, filename, timeout=300):
+    request = urllib.request.Request(f"{base}/scan?filename={filename}", data=data, method='POST',
+                                     headers={'Content-Type': 'application/octet-stream'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        job_id = json.load(response)["job_id"]
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with urllib.request.urlopen(f"{base}/jobs/{job_id}", timeout=timeout) as response:
+            job = json.load(response)
+        if job["status"] == "done":
+            return job
+        if job["status"] == "failed":
+            raise RuntimeError(f"Scan job failed: {job.get('error')}")
+        time.sleep(0.01)
+    raise TimeoutError(f"Scan job {job_id} did not finish within {timeout}s")
+
+
+# /scan throughput of the pre-forked server as workers are added; each round
+# uploads every scan at once and waits for all the jobs
+def bench_serving(suite):
+    import model_registry
+    import serving_config
+
+    if not hasattr(os, 'fork'):
+        raise Skip("serve.py needs fork()")
+    if importlib.util.find_spec('flask') is None:
+        raise Skip("Flask is not installed")
+    config = serving_config.load_config(os.path.join(REPO_DIR, serving_config.DEFAULT_CONFIG_PATH))
+    name = model_registry.scan_model_name(config.get('models', 'scan_backend'))
+    backend = 'keras' if name == 'brain_cnn' else name[len('brain_cnn_'):]
+    model_path = model_registry.BRAIN_MODEL_PATH if backend == 'keras' else model_registry.TFLITE_MODEL_PATHS[backend]
+    if not os.path.exists(os.path.join(REPO_DIR, model_path)):
+        raise Skip(f"no scan model at {model_path}")
+    scans = synthetic_scans(SERVING_SCANS)
+    counts = [n for n in SERVING_WORKERS if n <= max(2, os.cpu_count() or 1)][:2 if suite.quick else None]
+    throughput = {}
+    for workers in counts:
+        proc, base = _start_server(suite, workers)
+        try:
+            def scan_all():
+                with ThreadPoolExecutor(max_workers=4 * workers) as clients:
+                    list(clients.map(lambda i: _scan_over_http(base, scans[i], f"scan_{i}.jpg"), range(len(scans))))
+
+            # The warm-up round also loads the model in every worker and job process
+            result = suite.measure("serve.scan", scan_all, items=len(scans), repeat=3, workers=workers,
+                                   backend=backend, executor=config.get('jobs', 'executor'))
+            throughput[workers] = result["items_per_sec"]
+        finally:
+            _stop_server(proc)
+    print("  scaling: " + ", ".join(f"{n} workers {rate / throughput[counts[0]]:.2f}x"
+                                    for n, rate in throughput.items()))
+
+
+CASES = {
+    "scan": bench_scan,
+    "sentiment": bench_sentiment,
+    "users": bench_users,
+    "history": bench_history,
+    "pdf": bench_pdf,
+    "uploads": bench_uploads,
+    "serving": bench_serving,
+}
+
+
+# ----------------------------
+# Results
+# ----------------------------
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _environment():
+    versions = {}
+    for package in VERSIONED_PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            pass
+    threads = {k: os.environ[k] for k in ('OMP_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'TFLITE_THREADS') if k in os.environ}
+    return {"python": platform.python_version(), "platform": platform.platform(), "machine": platform.machine(),
+            "cpu_count": os.cpu_count(), "threads": threads, "packages": versions}
+
+
+def run(cases=None, repeat=DEFAULT_REPEAT, quick=False):
+    workdir = tempfile.mkdtemp(prefix='benchmark_')
+    suite = Suite(workdir, repeat, quick)
+    try:
+        for name in cases or CASES:
+            print(f"{name}:")
+            try:
+                CASES[name](suite)
+            except (Skip, ImportError) as exc:
+                suite.skipped[name] = str(exc)
+                print(f"  skipped: {exc}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    commit = _git("rev-parse", "HEAD")
+    return {
+        "commit": commit,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "settings": {"repeat": repeat, "quick": quick, "seed": SEED, "cases": list(cases or CASES)},
+        "environment": _environment(),
+        "results": suite.results,
+        "skipped": suite.skipped,
+    }
+
+
+def save(report, results_dir=RESULTS_DIR):
+    os.makedirs(results_dir, exist_ok=True)
+    name = (report["commit"] or "unknown")[:12] + ("-dirty" if report["dirty"] else "")
+    path = os.path.join(results_dir, f"{name}.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+# A results file path, or a commit / branch / tag whose saved result to use
+def resolve_baseline(ref, results_dir=RESULTS_DIR):
+    if os.path.isfile(ref):
+        return ref
+    commit = _git("rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}") or ref
+    # A run on a clean checkout of the commit, else one with local changes on top
+    for name in (f"{commit[:12]}.json", f"{commit[:12]}-dirty.json"):
+        path = os.path.join(results_dir, name)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"No saved benchmark result for {ref!r} in {results_dir}/; "
+                            f"check out that commit and run: python benchmark.py run")
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Per-case change of the median between two reports; regressions are flagged
+def compare(old, new, threshold=DEFAULT_THRESHOLD):
+    rows = []
+    for key, result in new["results"].items():
+        before = old["results"].get(key)
+        if before is None:
+            continue
+        delta = result["median_s"] - before["median_s"]
+        change = delta / before["median_s"] if before["median_s"] else 0.0
+        rows.append({"case": key, "old_s": before["median_s"], "new_s": result["median_s"], "change": change,
+                     "regression": change > threshold and delta > MIN_DELTA_SECONDS})
+    return rows
+
+
+def print_comparison(old, new, threshold=DEFAULT_THRESHOLD):
+    print(f"\nComparing {(new['commit'] or '?')[:12]} against {(old['commit'] or '?')[:12]} "
+          f"(regression = more than {threshold:.0%} slower)")
+    old_env, new_env = old["environment"], new["environment"]
+    if (old_env["platform"], old_env["cpu_count"]) != (new_env["platform"], new_env["cpu_count"]):
+        print("  warning: the two runs are from different machines; timings are not comparable")
+    rows = compare(old, new, threshold)
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"  {row['case']:<48} {row['old_s'] * 1000:10.2f} -> {row['new_s'] * 1000:10.2f} ms "
+              f"{row['change']:+8.1%}{flag}")
+    regressions = [row for row in rows if row["regression"]]
+    print(f"{len(regressions)} regression(s) in {len(rows)} comparable case(s)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the apps' hot paths and compare runs across commits")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run')
+    run_parser.add_argument('--only', default=None, help=f"comma-separated subset of: {', '.join(CASES)}")
+    run_parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    run_parser.add_argument('--quick', action='store_true', help="10k users only, 3 rounds")
+    run_parser.add_argument('--baseline', default=None, help="commit, branch or results file to compare against")
+    run_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    run_parser.add_argument('--results-dir', default=RESULTS_DIR)
+    cmp_parser = sub.add_parser('compare')
+    cmp_parser.add_argument('old')
+    cmp_parser.add_argument('new')
+    cmp_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        regressions = print_comparison(load(args.old), load(args.new), args.threshold)
+        return 1 if regressions else 0
+
+    cases = [c.strip() for c in args.only.split(',')] if args.only else None
+    unknown = set(cases or ()) - set(CASES)
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(sorted(unknown))}")
+    # Read the baseline first: a typo should not cost a whole run, and this
+    # run may overwrite the file (same commit)
+    try:
+        baseline = load(resolve_baseline(args.baseline, args.results_dir)) if args.baseline else None
+    except FileNotFoundError as exc:
+        parser.error(str(exc))
+    report = run(cases, 3 if args.quick else args.repeat, args.quick)
+    print(f"Saved {save(report, args.results_dir)}")
+    if baseline:
+        regressions = print_comparison(baseline, report, args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
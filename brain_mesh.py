@@ -0,0 +1,340 @@
+# ----------------------------
+# brain_mesh.py – Level-of-Detail Brain Surface Mesh Viewer
+# ----------------------------
+# Loads triangle meshes from OBJ, PLY (ASCII or binary) and STL (ASCII or
+# binary) files into NumPy arrays: vertices (n, 3) float32, faces (m, 3)
+# int32. Parsing is done on whole files at once (regex/split + one NumPy
+# conversion, or np.frombuffer for binary data) rather than line by line.
+# Each mesh is decimated once into a few levels of detail by vertex
+# clustering, and the serialized Plotly figure for every mesh/level pair is
+# cached, so a 100k+ triangle surface costs one parse per process and the
+# browser only ever receives the level that was asked for.
+#
+#   python brain_mesh.py brain.obj    (parse / decimation / serialization timings)
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from result_cache import LRUCache
+
+BRAIN_MESH_PATH = os.environ.get('BRAIN_MESH_PATH', 'assets/brain.obj')
+# Target triangle count per level of detail; None keeps the full mesh
+LOD_LEVELS = {"low": 8_000, "medium": 30_000, "high": 100_000, "full": None}
+DEFAULT_LOD = "medium"
+FIGURE_CACHE_MB = int(os.environ.get('MESH_FIGURE_CACHE_MB', 64))
+
+_meshes = LRUCache(maxsize=8)
+_figures = LRUCache(maxsize=64, max_bytes=FIGURE_CACHE_MB * 1024 * 1024)
+_build_lock = threading.Lock()
+
+_OBJ_VERTEX = re.compile(rb'^v[ \t]+(\S+[ \t]+\S+[ \t]+\S+)', re.M)
+_OBJ_FACE = re.compile(rb'^f[ \t]+([^\r\n#]*)', re.M)
+_OBJ_REF_SUFFIX = re.compile(rb'/\S*')
+_STL_VERTEX = re.compile(rb'vertex\s+(\S+\s+\S+\s+\S+)')
+_PLY_TYPES = {
+    b'char': 'i1', b'int8': 'i1', b'uchar': 'u1', b'uint8': 'u1',
+    b'short': 'i2', b'int16': 'i2', b'ushort': 'u2', b'uint16': 'u2',
+    b'int': 'i4', b'int32': 'i4', b'uint': 'u4', b'uint32': 'u4',
+    b'float': 'f4', b'float32': 'f4', b'double': 'f8', b'float64': 'f8',
+}
+
+
+def _numbers(chunks, dtype):
+    return np.array(b' '.join(chunks).split()).astype(dtype)
+
+
+# Triangulate polygons (each a list of vertex indices) as fans, grouped by size
+def _triangulate(polygons):
+    groups = {}
+    for polygon in polygons:
+        if len(polygon) >= 3:
+            groups.setdefault(len(polygon), []).append(polygon)
+    triangles = []
+    for size, rows in groups.items():
+        rows = np.asarray(rows, dtype=np.int64)
+        for corner in range(1, size - 1):
+            triangles.append(rows[:, [0, corner, corner + 1]])
+    return np.concatenate(triangles) if triangles else np.empty((0, 3), dtype=np.int64)
+
+
+def load_obj(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    vertices = _numbers(_OBJ_VERTEX.findall(data), np.float32).reshape(-1, 3)
+    rows = _OBJ_REF_SUFFIX.sub(b'', b'\n'.join(_OBJ_FACE.findall(data))).split(b'\n')
+    indices = _numbers(rows, np.int64)
+    if len(indices) == 3 * len(rows):
+        faces = indices.reshape(-1, 3)
+    else:
+        faces = _triangulate([[int(i) for i in row.split()] for row in rows])
+    # OBJ indices are 1-based; negative ones count back from the end
+    faces = np.where(faces < 0, faces + len(vertices), faces - 1)
+    return vertices, faces
+
+
+def _ply_header(f):
+    header = []
+    for line in f:
+        line = line.strip()
+        header.append(line)
+        if line == b'end_header':
+            break
+    if not header or header[0] != b'ply':
+        raise ValueError("Not a PLY file")
+    fmt, elements = None, []
+    for line in header:
+        words = line.split()
+        if words[0] == b'format':
+            fmt = words[1]
+        elif words[0] == b'element':
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == b'property':
+            if words[1] == b'list':
+                elements[-1][2].append((words[4], _PLY_TYPES[words[2]], _PLY_TYPES[words[3]]))
+            else:
+                elements[-1][2].append((words[2], _PLY_TYPES[words[1]], None))
+    return fmt, elements
+
+
+def load_ply(path):
+    with open(path, 'rb') as f:
+        fmt, elements = _ply_header(f)
+        body = f.read()
+    vertices = faces = None
+    if fmt == b'ascii':
+        values = np.array(body.split()).astype(np.float64)
+        pos = 0
+        for name, count, props in elements:
+            if all(item is None for _, _, item in props):
+                table = values[pos:pos + count * len(props)].reshape(count, len(props))
+                pos += count * len(props)
+                if name == b'vertex':
+                    columns = [p[0] for p in props]
+                    vertices = table[:, [columns.index(a) for a in (b'x', b'y', b'z')]].astype(np.float32)
+            else:
+                # Only a face element made of one list property is supported
+                if len(props) != 1:
+                    raise ValueError(f"Unsupported PLY element {name!r}")
+                if count and np.all(values[pos:pos + 4 * count:4] == 3):
+                    polygons = values[pos:pos + 4 * count].reshape(count, 4)[:, 1:].astype(np.int64)
+                    pos += 4 * count
+                else:
+                    rows = []
+                    for _ in range(count):
+                        n = int(values[pos])
+                        rows.append(values[pos + 1:pos + 1 + n].astype(np.int64).tolist())
+                        pos += 1 + n
+                    polygons = _triangulate(rows)
+                if name == b'face':
+                    faces = polygons
+    else:
+        order = '<' if fmt == b'binary_little_endian' else '>'
+        offset = 0
+        for name, count, props in elements:
+            if all(item is None for _, _, item in props):
+                dtype = np.dtype([(p[0].decode(), order + p[1]) for p in props])
+                table = np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+                offset += dtype.itemsize * count
+                if name == b'vertex':
+                    vertices = np.stack([table['x'], table['y'], table['z']], axis=1).astype(np.float32)
+            else:
+                if len(props) != 1:
+                    raise ValueError(f"Unsupported PLY element {name!r}")
+                _, count_type, item_type = props[0]
+                tri = np.dtype([('n', order + count_type), ('i', order + item_type, 3)])
+                table = np.frombuffer(body, dtype=tri, count=count, offset=offset) \
+                    if len(body) - offset >= tri.itemsize * count else None
+                if table is not None and np.all(table['n'] == 3):
+                    polygons = table['i'].astype(np.int64)
+                    offset += tri.itemsize * count
+                else:
+                    count_dtype, item_dtype = np.dtype(order + count_type), np.dtype(order + item_type)
+                    rows = []
+                    for _ in range(count):
+                        n = int(np.frombuffer(body, count_dtype, 1, offset)[0])
+                        offset += count_dtype.itemsize
+                        rows.append(np.frombuffer(body, item_dtype, n, offset).tolist())
+                        offset += item_dtype.itemsize * n
+                    polygons = _triangulate(rows)
+                if name == b'face':
+                    faces = polygons
+    if vertices is None or faces is None:
+        raise ValueError("PLY file has no vertex or face element")
+    return vertices, faces
+
+
+def load_stl(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    n = int(np.frombuffer(data, '<u4', 1, 80)[0]) if len(data) >= 84 else -1
+    if len(data) == 84 + 50 * n:
+        record = np.dtype([('normal', '<f4', 3), ('v', '<f4', (3, 3)), ('attr', '<u2')])
+        corners = np.frombuffer(data, record, n, 84)['v'].reshape(-1, 3)
+    else:
+        corners = _numbers(_STL_VERTEX.findall(data), np.float32).reshape(-1, 3)
+    # STL repeats every corner; weld identical positions into shared vertices
+    # (compared as 12-byte keys, much faster than np.unique(axis=0))
+    corners = np.ascontiguousarray(corners, dtype=np.float32)
+    _, first, inverse = np.unique(corners.view(np.dtype((np.void, 12))).ravel(),
+                                  return_index=True, return_inverse=True)
+    return corners[first], inverse.reshape(-1, 3)
+
+
+LOADERS = {'.obj': load_obj, '.ply': load_ply, '.stl': load_stl}
+
+
+# (vertices float32 (n, 3), faces int32 (m, 3)) for an OBJ, PLY or STL file
+def load_mesh(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in LOADERS:
+        raise ValueError(f"Unsupported mesh format {ext!r} (expected one of {', '.join(LOADERS)})")
+    vertices, faces = LOADERS[ext](path)
+    faces = np.asarray(faces)
+    if len(faces) and (faces.min() < 0 or faces.max() >= len(vertices)):
+        raise ValueError(f"{path}: face index out of range")
+    return np.ascontiguousarray(vertices, dtype=np.float32), np.ascontiguousarray(faces, dtype=np.int32)
+
+
+# Vertex clustering: snap vertices to a resolution^3 grid, merge each cell
+# into its mean position and drop the triangles that collapse
+def cluster_vertices(vertices, faces, resolution):
+    lo = vertices.min(axis=0)
+    span = float((vertices.max(axis=0) - lo).max()) or 1.0
+    cells = np.minimum(((vertices - lo) * (resolution / span)).astype(np.int64), resolution - 1)
+    keys = (cells[:, 0] * resolution + cells[:, 1]) * resolution + cells[:, 2]
+    _, cluster = np.unique(keys, return_inverse=True)
+    counts = np.bincount(cluster)
+    merged = np.stack([np.bincount(cluster, weights=vertices[:, a]) for a in range(3)], axis=1) / counts[:, None]
+    tris = cluster[faces]
+    tris = tris[(tris[:, 0] != tris[:, 1]) & (tris[:, 1] != tris[:, 2]) & (tris[:, 0] != tris[:, 2])]
+    # Clusters can be joined by several triangles; keep one of each
+    _, first = np.unique(np.sort(tris, axis=1), axis=0, return_index=True)
+    tris = tris[np.sort(first)]
+    used, tris = np.unique(tris, return_inverse=True)
+    return merged[used].astype(np.float32), tris.reshape(-1, 3).astype(np.int32)
+
+
+# Decimate to at most about `target_faces` triangles
+def decimate(vertices, faces, target_faces):
+    if target_faces is None or len(faces) <= target_faces:
+        return vertices, faces
+    # Surface triangle counts grow with resolution^2: aim, then correct once or twice
+    resolution, best = 64, None
+    for _ in range(4):
+        v, f = cluster_vertices(vertices, faces, resolution)
+        if len(f) <= target_faces and (best is None or len(f) > len(best[1])):
+            best = (v, f)
+        if 0.8 * target_faces <= len(f) <= target_faces:
+            break
+        resolution = max(4, int(resolution * (target_faces / max(len(f), 1)) ** 0.5 * 0.97))
+    return best if best is not None else cluster_vertices(vertices, faces, 4)
+
+
+def build_lods(vertices, faces):
+    return {level: decimate(vertices, faces, target) for level, target in LOD_LEVELS.items()}
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+# All levels of detail of a mesh file, parsed and decimated once per file version
+def mesh_lods(path):
+    key = _file_key(path)
+    lods = _meshes.get(key)
+    if lods is None:
+        with _build_lock:
+            lods = _meshes.get(key)
+            if lods is None:
+                lods = build_lods(*load_mesh(path))
+                _meshes.put(key, lods)
+    return lods
+
+
+def _make_figure(vertices, faces):
+    fig = go.Figure(data=go.Mesh3d(
+        x=vertices[:, 0], y=vertices[:, 1], z=vertices[:, 2],
+        i=faces[:, 0], j=faces[:, 1], k=faces[:, 2],
+        color='lightblue',
+        flatshading=False,
+    ))
+    fig.update_layout(
+        margin=dict(l=0, r=0, b=0, t=0),
+        scene=dict(
+            xaxis_title='X',
+            yaxis_title='Y',
+            zaxis_title='Z',
+            aspectmode='data'
+        )
+    )
+    return fig
+
+
+# Serialized Plotly figure (arrays as compact typed-array data) for one level
+def figure_json(path, level=DEFAULT_LOD):
+    key = (_file_key(path), level)
+    data = _figures.get(key)
+    if data is None:
+        data = pio.to_json(_make_figure(*mesh_lods(path)[level]), validate=False)
+        _figures.put(key, data)
+    return data
+
+
+# Rebuilt from the cached JSON without re-validating the arrays
+def mesh_figure(path, level=DEFAULT_LOD):
+    return go.Figure(json.loads(figure_json(path, level)))
+
+
+def cache_stats():
+    return {"meshes": _meshes.stats(), "figures": _figures.stats()}
+
+
+# Bumpy sphere with roughly 2 * n^2 triangles, for tests and benchmarks
+def make_test_mesh(n=256):
+    theta, phi = np.meshgrid(np.linspace(0, np.pi, n), np.linspace(0, 2 * np.pi, n, endpoint=False), indexing='ij')
+    r = 1 + 0.05 * np.sin(8 * theta) * np.cos(12 * phi)
+    vertices = np.stack([r * np.sin(theta) * np.cos(phi), r * np.sin(theta) * np.sin(phi), r * np.cos(theta)],
+                        axis=-1).reshape(-1, 3).astype(np.float32)
+    a = (np.arange(n - 1)[:, None] * n + np.arange(n)[None, :]).ravel()
+    b = (np.arange(n - 1)[:, None] * n + (np.arange(n)[None, :] + 1) % n).ravel()
+    faces = np.concatenate([np.stack([a, a + n, b], 1), np.stack([b, a + n, b + n], 1)]).astype(np.int32)
+    return vertices, faces
+
+
+def save_obj(path, vertices, faces):
+    with open(path, 'w') as f:
+        np.savetxt(f, vertices, fmt='v %.6f %.6f %.6f')
+        np.savetxt(f, faces + 1, fmt='f %d %d %d')
+
+
+def benchmark(path):
+    start = time.perf_counter()
+    vertices, faces = load_mesh(path)
+    result = {"vertices": len(vertices), "faces": len(faces), "parse_s": time.perf_counter() - start, "levels": {}}
+    for level, target in LOD_LEVELS.items():
+        start = time.perf_counter()
+        v, f = decimate(vertices, faces, target)
+        decimate_s = time.perf_counter() - start
+        start = time.perf_counter()
+        data = pio.to_json(_make_figure(v, f), validate=False)
+        result["levels"][level] = {"faces": len(f), "decimate_s": decimate_s,
+                                   "serialize_s": time.perf_counter() - start, "json_bytes": len(data)}
+    return result
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit("usage: python brain_mesh.py MESH.obj|.ply|.stl")
+    r = benchmark(sys.argv[1])
+    print(f"{r['vertices']} vertices, {r['faces']} faces, parsed in {r['parse_s']:.2f}s")
+    for level, l in r["levels"].items():
+        print(f"  {level}: {l['faces']} faces, decimated in {l['decimate_s']:.2f}s, "
+              f"{l['json_bytes'] / 1024:.0f} KB JSON in {l['serialize_s']:.2f}s")
@@ -0,0 +1,111 @@
+# ----------------------------
+# chatbot.py – Sentiment-Based Chatbot
+# ----------------------------
+# Supportive replies picked from the message's sentiment (cached, with a
+# length-bucketed batch variant) and the streaming gpt2 mode. Imported by the
+# Streamlit app and by benchmark.py, so both run the same code.
+import random
+import time
+import model_registry
+import result_cache
+from streaming_chat import ChatSession
+
+# Built on first use and freed again after GPT2_IDLE_TIMEOUT idle seconds
+chatbot_pipe = model_registry.lazy('gpt2')
+sentiment_pipe = model_registry.get('sentiment')
+
+responses = {
+    "greeting": [
+        "Hi there! How are you feeling today?",
+        "Hello! I’m here to talk if you’d like to share anything."
+    ],
+    "sad": [
+        "I'm sorry you're feeling that way. Do you want to talk about it?",
+        "It's okay to feel sad. I'm here to listen."
+    ],
+    "happy": [
+        "That’s great to hear! Keep smiling!",
+        "Wonderful! Happiness is contagious."
+    ]
+}
+
+# Repeated messages ("hi", "ok", "I feel sad") are answered from the cache.
+# The default sentiment model is uncased, so lower-casing the key is safe.
+sentiment_cache = result_cache.get_cache('sentiment', maxsize=10000, ttl=24 * 3600)
+
+def classify_sentiment(user_input):
+    key = result_cache.normalize_text(user_input)
+    cached = sentiment_cache.get(key)
+    if cached is not None:
+        return cached
+    sentiment = sentiment_pipe(user_input)[0]
+    result = (sentiment['label'], sentiment['score'])
+    sentiment_cache.put(key, result)
+    return result
+
+def respond_to_label(label):
+    if label == 'NEGATIVE':
+        return random.choice(responses['sad'])
+    elif label == 'POSITIVE':
+        return random.choice(responses['happy'])
+    else:
+        return random.choice(responses['greeting'])
+
+def chatbot_response(user_input):
+    label, score = classify_sentiment(user_input)
+    return respond_to_label(label)
+
+# Generative mode: gpt2 replies streamed token by token, reusing the KV state across turns
+def new_chat_session(**kwargs):
+    return ChatSession(chatbot_pipe, **kwargs)
+
+def stream_chatbot_response(session, user_input):
+    return session.stream_reply(user_input)
+
+BUCKET_SIZE = 32
+
+# Classify many messages (log replays, queued requests) in a few pipeline calls.
+# Cache hits and duplicates are resolved first; the remaining texts are sorted
+# by length and cut into buckets so each forward pass pads to a similar length.
+def classify_sentiment_batch(messages, bucket_size=BUCKET_SIZE):
+    results = [None] * len(messages)
+    pending = {}
+    for i, message in enumerate(messages):
+        key = result_cache.normalize_text(message)
+        cached = sentiment_cache.get(key)
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.setdefault(key, []).append(i)
+
+    keys = sorted(pending, key=len)
+    for start in range(0, len(keys), bucket_size):
+        bucket = keys[start:start + bucket_size]
+        texts = [messages[pending[key][0]] for key in bucket]
+        outputs = sentiment_pipe(texts, batch_size=len(texts), truncation=True)
+        for key, sentiment in zip(bucket, outputs):
+            result = (sentiment['label'], sentiment['score'])
+            sentiment_cache.put(key, result)
+            for i in pending[key]:
+                results[i] = result
+    return results
+
+# Responses come back in the same order as the input messages
+def chatbot_response_batch(messages, bucket_size=BUCKET_SIZE):
+    return [respond_to_label(label) for label, _ in classify_sentiment_batch(messages, bucket_size)]
+
+# Messages/sec of chatbot_response_batch against one chatbot_response call per
+# message. The sentiment cache is cleared before each run so both start cold.
+def compare_chatbot_throughput(messages, bucket_size=BUCKET_SIZE):
+    if not messages:
+        return {"single_msgs_per_sec": 0.0, "batch_msgs_per_sec": 0.0, "speedup": None}
+    sentiment_cache.clear()
+    start = time.perf_counter()
+    for message in messages:
+        chatbot_response(message)
+    single = len(messages) / (time.perf_counter() - start)
+    sentiment_cache.clear()
+    start = time.perf_counter()
+    chatbot_response_batch(messages, bucket_size)
+    batched = len(messages) / (time.perf_counter() - start)
+    return {"single_msgs_per_sec": single, "batch_msgs_per_sec": batched, "speedup": batched / single}
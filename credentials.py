@@ -0,0 +1,288 @@
+# ----------------------------
+# credentials.py – Password Hashing, Verification Pool and Session Tokens
+# ----------------------------
+# Passwords are stored as self-describing, salted key-derivation hashes:
+#   scrypt$<n>$<r>$<p>$<salt>$<hash>      pbkdf2_sha256$<iterations>$<salt>$<hash>
+# so the cost can be raised later without breaking existing accounts. Old
+# unsalted SHA-256 entries still verify and are re-hashed on the next
+# successful login. The derivation runs in a small, bounded thread pool
+# (hashlib releases the GIL while it works), so a burst of logins cannot
+# use more than AUTH_WORKERS cores or scrypt buffers at once, and the
+# Streamlit script threads of other sessions keep running meanwhile.
+#
+# After a login the app gets an HMAC-signed session token that is kept in
+# the URL. It names the user, an expiry time (SESSION_TTL, 8 hours by
+# default) and a fingerprint of the stored hash plus the user's token
+# generation, so a password change or a logout (revoke) invalidates every
+# token issued before it. Returning sessions, and sessions on a restarted
+# worker, check the token instead of the password.
+#
+#   python credentials.py    (logins/sec at each cost setting)
+import base64
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from append_log import PerProcess
+from result_cache import LRUCache
+from user_store import get_user_store
+
+KDF_SCHEME = os.environ.get('KDF_SCHEME', 'scrypt')
+# scrypt memory/CPU cost: 128 * r * n bytes per hash (16 MB at n=2**14, r=8)
+SCRYPT_N = int(os.environ.get('SCRYPT_N', 2 ** 14))
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = int(os.environ.get('PBKDF2_ITERATIONS', 600_000))
+AUTH_WORKERS = int(os.environ.get('AUTH_WORKERS', max(1, min(4, os.cpu_count() or 1))))
+AUTH_TIMEOUT = 30
+# Tokens live in the URL (browser history, logs, copied links), so keep them short-lived
+SESSION_TTL = int(os.environ.get('SESSION_TTL', 8 * 3600))
+# Usernames also name per-user files (e.g. secure_data/<user>_history.txt)
+USERNAME_PATTERN = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _derive(scheme, password, salt, params):
+    if scheme == "scrypt":
+        n, r, p = params
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * r * n + 2 ** 20, dklen=32)
+    if scheme == "pbkdf2_sha256":
+        (iterations,) = params
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+    raise ValueError(f"Unknown password hash scheme {scheme!r}")
+
+
+def _current_params(scheme):
+    return (SCRYPT_N, SCRYPT_R, SCRYPT_P) if scheme == "scrypt" else (PBKDF2_ITERATIONS,)
+
+
+# Stored form of a new password hash
+def hash_password(password, scheme=None, params=None):
+    scheme = scheme or KDF_SCHEME
+    params = params or _current_params(scheme)
+    salt = secrets.token_bytes(16)
+    digest = _derive(scheme, password, salt, params)
+    return "$".join([scheme, *map(str, params), _b64(salt), _b64(digest)])
+
+
+def _is_legacy(stored):
+    return len(stored) == 64 and all(c in "0123456789abcdef" for c in stored)
+
+
+# (matches, needs_rehash) for a stored hash of any supported format
+def verify_password(stored, password):
+    if _is_legacy(stored):
+        ok = hmac.compare_digest(stored, hashlib.sha256(password.encode()).hexdigest())
+        return ok, ok
+    try:
+        scheme, *params, salt, digest = stored.split("$")
+        params = tuple(int(x) for x in params)
+        ok = hmac.compare_digest(_derive(scheme, password, _unb64(salt), params), _unb64(digest))
+    except (ValueError, TypeError):
+        return False, False
+    return ok, ok and (scheme != KDF_SCHEME or params != _current_params(scheme))
+
+
+# Hash checked for unknown users, so they take as long as real ones
+_DUMMY_HASH = None
+
+
+def _dummy_hash():
+    global _DUMMY_HASH
+    if _DUMMY_HASH is None:
+        _DUMMY_HASH = hash_password(secrets.token_hex(8))
+    return _DUMMY_HASH
+
+
+# What authenticate() and register() return when the verification pool is too
+# busy to answer within the timeout: neither a success nor a failure, so the
+# caller should ask the user to try again
+BUSY = None
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="auth")
+        return _pool
+
+
+def _authenticate(user_store, username, password):
+    stored = user_store.get(username) if username else None
+    if stored is None:
+        verify_password(_dummy_hash(), password)
+        return False
+    ok, needs_rehash = verify_password(stored, password)
+    if needs_rehash:
+        # Upgrade legacy SHA-256 (or outdated cost) entries in place
+        user_store.update(username, hash_password(password))
+    return ok
+
+
+def _on_pool(timeout, fn, *args):
+    future = _get_pool().submit(fn, *args)
+    try:
+        return future.result(timeout)
+    except FutureTimeout:
+        future.cancel()  # only has an effect if it has not started yet
+        return BUSY
+
+
+# Check a login against a user_store.UserStore on the verification pool;
+# True, False, or BUSY when the pool did not get to it within `timeout`
+def authenticate(user_store, username, password, timeout=AUTH_TIMEOUT):
+    return _on_pool(timeout, _authenticate, user_store, username, password)
+
+
+def valid_username(username):
+    return bool(username) and USERNAME_PATTERN.fullmatch(username) is not None
+
+
+# Register a user with a KDF hash computed on the verification pool; False
+# if the name is invalid or taken, BUSY if the pool did not get to it in time
+def register(user_store, username, password, timeout=AUTH_TIMEOUT):
+    if not valid_username(username) or not password:
+        return False
+    if username in user_store:
+        return False
+    stored = _on_pool(timeout, hash_password, password)
+    if stored is BUSY:
+        return BUSY
+    return user_store.add(username, stored)
+
+
+def _load_secret(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(secrets.token_bytes(32))
+    os.chmod(tmp, 0o600)
+    # link() fails if the key exists: when two workers race, both use the winner's key
+    try:
+        os.link(tmp, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp)
+    return _load_secret(path)
+
+
+def _fingerprint(stored, generation=0):
+    text = f"{stored}#{generation}" if generation else stored
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+class SessionTokens:
+    def __init__(self, secret_path, ttl=SESSION_TTL):
+        self.secret = _load_secret(secret_path)
+        self.ttl = ttl
+        # username -> token generation, bumped by revoke(); shared by every worker
+        self._generations = get_user_store(f"{secret_path}.generations", sep="\t")
+        # Tokens whose signature was already checked recently: reruns skip the HMAC
+        self._verified = LRUCache(maxsize=4096, ttl=60)
+
+    def _sign(self, payload):
+        return _b64(hmac.new(self.secret, payload.encode(), hashlib.sha256).digest())
+
+    def _generation(self, username):
+        return int(self._generations.get(username) or 0)
+
+    def issue(self, user_store, username):
+        fingerprint = _fingerprint(user_store.get(username), self._generation(username))
+        payload = f"{_b64(username.encode())}.{int(time.time()) + self.ttl}.{fingerprint}"
+        return f"{payload}.{self._sign(payload)}"
+
+    # Log the user out everywhere: every token issued so far stops verifying
+    def revoke(self, username):
+        return self._generations.update(username, str(self._generation(username) + 1))
+
+    # The username a token was issued to, or None if it is forged, expired or revoked
+    def verify(self, token, user_store):
+        if not token:
+            return None
+        checked = self._verified.get(token)
+        if checked is None:
+            try:
+                name, expires, fingerprint, signature = token.split(".")
+                checked = (_unb64(name).decode(), int(expires), fingerprint)
+            except (ValueError, UnicodeDecodeError):
+                return None
+            if not hmac.compare_digest(signature.encode(), self._sign(f"{name}.{expires}.{fingerprint}").encode()):
+                return None
+            self._verified.put(token, checked)
+        username, expires, fingerprint = checked
+        # Both lookups are O(1) index hits, so revocation still takes effect at once
+        stored = user_store.get(username)
+        if expires < time.time() or stored is None or not hmac.compare_digest(
+                fingerprint.encode(), _fingerprint(stored, self._generation(username)).encode()):
+            return None
+        return username
+
+    def stats(self):
+        return self._verified.stats()
+
+
+_token_stores = PerProcess(SessionTokens)
+
+
+# One token signer per key file per process
+def get_session_tokens(secret_path, ttl=SESSION_TTL):
+    return _token_stores.get(os.path.abspath(secret_path), secret_path, ttl)
+
+
+# Logins/sec through the verification pool at one cost setting
+def benchmark_logins(scheme, params, logins=None, workers=AUTH_WORKERS):
+    stored = hash_password("correct horse", scheme, params)
+    start = time.perf_counter()
+    single = verify_password(stored, "correct horse")
+    per_login = time.perf_counter() - start
+    assert single[0]
+    logins = logins or max(workers, min(200, int(2.0 / max(per_login, 1e-4))))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda _: verify_password(stored, "correct horse"), range(logins)))
+    elapsed = time.perf_counter() - start
+    return {"scheme": scheme, "params": params, "ms_per_login": per_login * 1000,
+            "logins_per_sec": logins / elapsed, "workers": workers}
+
+
+DEFAULT_BENCHMARK_COSTS = [
+    ("scrypt", (2 ** 12, 8, 1)),
+    ("scrypt", (2 ** 14, 8, 1)),
+    ("scrypt", (2 ** 15, 8, 1)),
+    ("scrypt", (2 ** 16, 8, 1)),
+    ("pbkdf2_sha256", (100_000,)),
+    ("pbkdf2_sha256", (300_000,)),
+    ("pbkdf2_sha256", (600_000,)),
+]
+
+
+if __name__ == '__main__':
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else AUTH_WORKERS
+    for scheme, params in DEFAULT_BENCHMARK_COSTS:
+        r = benchmark_logins(scheme, params, workers=workers)
+        print(f"{scheme} {'/'.join(map(str, params))}: {r['ms_per_login']:.0f} ms per login, "
+              f"{r['logins_per_sec']:.1f} logins/sec with {workers} worker(s)")
@@ -0,0 +1,63 @@
+# ----------------------------
+# encrypted_history.py – Incremental Decryption Cache for User History
+# ----------------------------
+# Each line of secure_data/<user>_history.txt is one Fernet token. The cache
+# remembers how far into the file it has read, so a refresh only picks up
+# lines appended since then. Tokens are decrypted lazily, one record at a
+# time, when a page that shows them is requested, and kept once decrypted.
+import ast
+import json
+
+from append_log import FileTail
+
+
+# Records are stored as JSON so they can be read back without guessing
+def encode_record(record):
+    return json.dumps(record, ensure_ascii=False)
+
+
+def decode_record(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        # Older entries were written with str(record)
+        try:
+            return ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            return text
+
+
+class EncryptedHistoryCache:
+    def __init__(self, path, fernet):
+        self.path = path
+        self.fernet = fernet
+        self._tail = FileTail(path)
+        self._reset()
+
+    def _reset(self):
+        self._tokens = []
+        self._records = {}
+
+    # Pick up lines appended since the last refresh (no decryption happens here)
+    def refresh(self):
+        data, _, restarted = self._tail.read_new()
+        if restarted:
+            self._reset()
+        self._tokens.extend(line.strip() for line in data.splitlines() if line.strip())
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def record(self, i):
+        record = self._records.get(i)
+        if record is None:
+            record = self._records[i] = decode_record(self.fernet.decrypt(self._tokens[i]).decode())
+        return record
+
+    # Records for one page (numbered from 0), newest first; only these are decrypted
+    def page(self, page, page_size=10):
+        newest = len(self._tokens) - 1 - page * page_size
+        return [self.record(i) for i in range(newest, max(newest - page_size, -1), -1)]
+
+    def records(self):
+        return [self.record(i) for i in range(len(self._tokens))]
@@ -1,8 +1,12 @@
 import streamlit as st
 import os
 from datetime import date
-import hashlib
-from PIL import Image
+from user_store import get_user_store
+from credentials import BUSY, authenticate, get_session_tokens, register, valid_username
+from patient_history import get_patient_history
+from upload_store import get_upload_store
+from scan_previews import get_preview_store
+from brain_mesh import BRAIN_MESH_PATH, DEFAULT_LOD, LOD_LEVELS, mesh_figure
 
 # Set page config
 st.set_page_config(page_title="AI Brain Scan Chatbot", layout="centered")
@@ -10,39 +14,51 @@ st.set_page_config(page_title="AI Brain Scan Chatbot", layout="centered")
 # Upload folder
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+upload_store = get_upload_store(UPLOAD_FOLDER)
+preview_store = get_preview_store(UPLOAD_FOLDER)
 
 # File paths
 USER_FILE = "users.txt"  # Stores usernames and hashed passwords
-PATIENT_HISTORY_FILE = "patient_history.txt"  # Stores patient scan history
-
-# Function to load existing users from the file
-def load_users():
-    users = {}
-    if os.path.exists(USER_FILE):
-        with open(USER_FILE, "r") as file:
-            for line in file:
-                username, hashed_password = line.strip().split(":")
-                users[username] = hashed_password
-    return users
-
-# Function to register new users with hashed passwords
+SESSION_KEY_FILE = "session.key"  # Signs the session tokens of logged-in users
+PATIENT_HISTORY_FILE = "patient_history.jsonl"  # Stores patient scan history, one JSON record per line
+LEGACY_PATIENT_HISTORY_FILE = "patient_history.txt"  # Old comma-separated history, imported once
+HISTORY_PAGE_SIZE = 25
+
+# Indexed view of the users file, kept in memory across reruns
+user_store = get_user_store(USER_FILE, sep=":")
+session_tokens = get_session_tokens(SESSION_KEY_FILE)
+
+# Function to register new users with salted scrypt hashes (False if the name is taken)
 def register_user(username, password):
-    hashed_password = hashlib.sha256(password.encode()).hexdigest()
-    with open(USER_FILE, "a") as file:
-        file.write(f"{username}:{hashed_password}\n")
+    return register(user_store, username, password)
 
-# Function to validate password with SHA-256 hashing
-def validate_password(stored_hash, password):
-    return stored_hash == hashlib.sha256(password.encode()).hexdigest()
+# Indexed patient history, kept in memory across reruns
+patient_history = get_patient_history(PATIENT_HISTORY_FILE, legacy_path=LEGACY_PATIENT_HISTORY_FILE)
 
 # Function to save patient history
 def save_patient_history(patient_name, patient_age, scan_date, scan_type, referring_physician, analysis_result):
-    with open(PATIENT_HISTORY_FILE, "a") as file:
-        file.write(f"{patient_name},{patient_age},{scan_date},{scan_type},{referring_physician},{analysis_result}\n")
+    patient_history.append({
+        "name": patient_name,
+        "age": patient_age,
+        "scan_date": scan_date,
+        "scan_type": scan_type,
+        "physician": referring_physician,
+        "result": analysis_result,
+    })
 
 # Session state to track login
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
+if "username" not in st.session_state:
+    st.session_state.username = ""
+
+# Returning sessions (page reloads, restarted workers) sign in with the token
+# kept in their URL instead of hashing the password again
+if not st.session_state.authenticated:
+    token_user = session_tokens.verify(st.query_params.get("session"), user_store)
+    if token_user:
+        st.session_state.authenticated = True
+        st.session_state.username = token_user
 
 # Login form
 def login_form():
@@ -50,9 +66,14 @@ def login_form():
     username = st.text_input("Username")
     password = st.text_input("Password", type="password")
     if st.button("Login"):
-        users = load_users()
-        if username in users and validate_password(users[username], password):
+        # Hashed on the shared verification pool; legacy SHA-256 entries are upgraded
+        ok = authenticate(user_store, username, password)
+        if ok is BUSY:
+            st.warning("The server is busy right now; please try again in a moment.")
+        elif ok:
             st.session_state.authenticated = True
+            st.session_state.username = username
+            st.query_params["session"] = session_tokens.issue(user_store, username)
             st.success("Login successful!")
             st.experimental_rerun()
         else:
@@ -61,6 +82,15 @@ def login_form():
         st.session_state.authenticated = False
         st.experimental_rerun()
 
+# Logout revokes every token of this user on the server (the old URL may
+# have been bookmarked, logged or shared) and drops it from the URL
+def logout():
+    session_tokens.revoke(st.session_state.username)
+    if "session" in st.query_params:
+        del st.query_params["session"]
+    st.session_state.authenticated = False
+    st.session_state.username = ""
+
 # Registration form
 def registration_form():
     st.title("🔑 Register New Account")
@@ -71,12 +101,15 @@ def registration_form():
     if st.button("Register"):
         if password != confirm_password:
             st.error("Passwords do not match!")
+        elif not valid_username(username):
+            st.error("Usernames may only contain letters, digits, '_', '-' and '.'.")
         else:
-            users = load_users()
-            if username in users:
+            registered = register_user(username, password)
+            if registered is BUSY:
+                st.warning("The server is busy right now; please try again in a moment.")
+            elif not registered:
                 st.error("Username already exists. Please choose another one.")
             else:
-                register_user(username, password)
                 st.success("Account created successfully! Please login.")
                 st.session_state.authenticated = False
                 st.experimental_rerun()
@@ -96,13 +129,12 @@ def brain_scan_app():
     uploaded_file = st.file_uploader("Upload a brain scan image (e.g., MRI, CT)", type=["png", "jpg", "jpeg"])
 
     if uploaded_file is not None:
-        filename = uploaded_file.name
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        with open(filepath, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        # Stored once per unique scan; reruns and re-uploads do not rewrite it
+        stored = upload_store.put_uploaded_file(uploaded_file, patient=patient_name)
 
         st.success("✅ Scan uploaded successfully!")
-        st.image(filepath, caption="Uploaded Brain Scan", use_column_width=True)
+        # Downscaled preview, made once per unique scan
+        st.image(preview_store.for_upload(stored), caption="Uploaded Brain Scan", use_column_width=True)
 
         # Simulated brain scan analysis
         analysis_result = "Detected possible abnormality in frontal lobe."
@@ -150,27 +182,46 @@ def brain_scan_app():
         st.subheader("✅ Final Suggestion")
         st.success("Based on the scan, it's recommended to consult a neurologist for further evaluation.")
 
-        # 3D Brain Model (Static Image as Placeholder)
-        st.subheader("🧠 Brain Model Viewer (Illustrative)")
-        
-        # Load a placeholder brain model (use your own model images here)
-        brain_image = Image.open("path_to_3d_brain_image.png")  # Replace with the actual path to your 3D model image
-        st.image(brain_image, caption="3D Brain Model", use_column_width=True)
+        # 3D Brain Model Viewer: decimated levels of detail, parsed and serialized once per mesh
+        st.subheader("🧠 3D Brain Model Viewer")
+        if os.path.exists(BRAIN_MESH_PATH):
+            detail = st.select_slider("Level of detail", options=list(LOD_LEVELS), value=DEFAULT_LOD)
+            st.plotly_chart(mesh_figure(BRAIN_MESH_PATH, detail), use_container_width=True)
+        else:
+            st.info(f"No brain mesh found at {BRAIN_MESH_PATH} (OBJ, PLY or STL; set BRAIN_MESH_PATH).")
 
 # Display the patient history
 def display_patient_history():
     st.title("📜 Patient Scan History")
 
-    if os.path.exists(PATIENT_HISTORY_FILE):
-        with open(PATIENT_HISTORY_FILE, "r") as file:
-            st.write("### Previous Patient Scans")
-            for line in file:
-                patient_data = line.strip().split(",")
-                st.write(f"**Name**: {patient_data[0]} | **Age**: {patient_data[1]} | **Scan Date**: {patient_data[2]} | **Scan Type**: {patient_data[3]} | **Referring Physician**: {patient_data[4]}")
-                st.write(f"**Analysis Result**: {patient_data[5]}")
-                st.markdown("---")
-    else:
+    if len(patient_history) == 0:
         st.write("No scan history found.")
+        return
+
+    st.write("### Previous Patient Scans")
+    name_filter = st.text_input("Filter by Patient Name")
+    type_filter = st.selectbox("Filter by Scan Type", ["All", "MRI", "CT", "PET", "SPECT"])
+    date_range = st.date_input("Filter by Scan Date Range", value=())
+    date_from = date_range[0] if len(date_range) > 0 else None
+    date_to = date_range[1] if len(date_range) > 1 else date_from
+
+    rows = patient_history.query(name=name_filter, scan_type=None if type_filter == "All" else type_filter,
+                                 date_from=date_from, date_to=date_to)
+    if not rows:
+        st.write("No scans match these filters.")
+        return
+    page_count = (len(rows) + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+    page = st.number_input("Page", min_value=1, max_value=page_count, value=1)
+    records = patient_history.page(rows, page - 1, HISTORY_PAGE_SIZE)
+    st.table([{
+        "Name": r["name"],
+        "Age": r["age"],
+        "Scan Date": r["scan_date"],
+        "Scan Type": r["scan_type"],
+        "Referring Physician": r["physician"],
+        "Analysis Result": r["result"],
+    } for r in records])
+    st.caption(f"{len(rows)} matching scans · page {page} of {page_count}")
 
 # Run app
 if not st.session_state.authenticated:
@@ -180,6 +231,9 @@ if not st.session_state.authenticated:
     elif mode == "Register":
         registration_form()
 else:
+    if st.sidebar.button("Logout"):
+        logout()
+        st.experimental_rerun()
     app_mode = st.sidebar.selectbox("Select App Mode", ["Brain Scan Analysis", "Patient Scan History"])
     if app_mode == "Brain Scan Analysis":
         brain_scan_app()
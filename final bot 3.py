@@ -1,14 +1,21 @@
 import streamlit as st
 import os
-import hashlib
+import re
 from datetime import date, datetime
-from fpdf import FPDF
 from cryptography.fernet import Fernet
-import base64
+from user_store import get_user_store
+from credentials import BUSY, authenticate, get_session_tokens, register, valid_username
+from encrypted_history import EncryptedHistoryCache, encode_record
+from batch_writer import get_writer
+from upload_store import get_upload_store
+from scan_previews import get_preview_store
+from pdf_reports import cached_report, history_reports_zip, report_cache
 
 # Setup directories
 os.makedirs("uploads", exist_ok=True)
 os.makedirs("secure_data", exist_ok=True)
+upload_store = get_upload_store("uploads")
+preview_store = get_preview_store("uploads")
 
 # Load/generate AES key
 KEY_FILE = "secure_data/secret.key"
@@ -19,34 +26,21 @@ with open(KEY_FILE, "rb") as f:
     fernet = Fernet(f.read())
 
 USER_DB = "secure_data/users.txt"
+SESSION_KEY_FILE = "secure_data/session.key"
+HISTORY_PAGE_SIZE = 10
+SAVE_TIMEOUT = 10  # seconds to wait for a history entry to reach disk
+# Shared background writer for every user's history file, with group fsync
+history_writer = get_writer(name="user-history", fsync=True)
+user_store = get_user_store(USER_DB, sep=",")
+session_tokens = get_session_tokens(SESSION_KEY_FILE)
 
 # Utility Functions
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
 def register_user(username, password):
-    if not username or not password:
-        return False
-    if not os.path.exists(USER_DB):
-        open(USER_DB, "w").close()
-    with open(USER_DB, "r") as f:
-        users = f.read().splitlines()
-    for u in users:
-        if u.split(",")[0] == username:
-            return False
-    with open(USER_DB, "a") as f:
-        f.write(f"{username},{hash_password(password)}\n")
-    return True
+    return register(user_store, username, password)
 
+# Salted scrypt check on the shared verification pool; legacy SHA-256 entries are upgraded
 def authenticate_user(username, password):
-    if not os.path.exists(USER_DB):
-        return False
-    with open(USER_DB, "r") as f:
-        for line in f:
-            stored_user, stored_hash = line.strip().split(",")
-            if username == stored_user and hash_password(password) == stored_hash:
-                return True
-    return False
+    return authenticate(user_store, username, password)
 
 def encrypt_text(text):
     return fernet.encrypt(text.encode()).decode()
@@ -54,29 +48,33 @@ def encrypt_text(text):
 def decrypt_text(text):
     return fernet.decrypt(text.encode()).decode()
 
+# Names with anything but letters, digits, "_", "-" or "." (e.g. "bob/x") are
+# hex-encoded, so a username can never point outside secure_data/
+SAFE_FILE_NAME = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]*")
+
+def history_path(username):
+    path = f"secure_data/{username}_history.txt"
+    if SAFE_FILE_NAME.fullmatch(username):
+        return path
+    # History saved under the raw name before encoding (e.g. "jane doe") stays
+    # where it is, as long as that file sits directly in secure_data/
+    if "/" not in username and "\\" not in username and os.path.isfile(path):
+        return path
+    return f"secure_data/%{username.encode('utf-8').hex()}_history.txt"
+
+# Waits until the entry is on disk; raises if it could not be written (the
+# writer keeps it and retries) or did not get there within SAVE_TIMEOUT
 def save_history(username, record):
-    enc = encrypt_text(record)
-    with open(f"secure_data/{username}_history.txt", "a") as f:
-        f.write(enc + "\n")
+    enc = encrypt_text(encode_record(record))
+    history_writer.write(enc, path=history_path(username)).result(timeout=SAVE_TIMEOUT)
 
+# Decrypted history kept in the session; each render only reads newly appended lines
 def get_history(username):
-    path = f"secure_data/{username}_history.txt"
-    if not os.path.exists(path):
-        return []
-    with open(path, "r") as f:
-        return [decrypt_text(line.strip()) for line in f.readlines()]
-
-def create_pdf(patient_data, diagnosis, output_path):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, "Brain Scan Diagnostic Report", ln=True, align='C')
-    pdf.ln(10)
-    for k, v in patient_data.items():
-        pdf.cell(200, 10, f"{k}: {v}", ln=True)
-    pdf.ln(5)
-    pdf.multi_cell(200, 10, f"Diagnosis:\n{diagnosis}")
-    pdf.output(output_path)
+    cache = st.session_state.get("history_cache")
+    if cache is None or cache.path != history_path(username):
+        cache = st.session_state.history_cache = EncryptedHistoryCache(history_path(username), fernet)
+    cache.refresh()
+    return cache
 
 # Streamlit App
 st.set_page_config(page_title="Secure Brain Scan App", layout="centered")
@@ -87,6 +85,27 @@ if "authenticated" not in st.session_state:
 if "username" not in st.session_state:
     st.session_state.username = ""
 
+# Returning sessions (page reloads, restarted workers) sign in with the token
+# kept in their URL instead of hashing the password again
+if not st.session_state.authenticated:
+    token_user = session_tokens.verify(st.query_params.get("session"), user_store)
+    if token_user:
+        st.session_state.authenticated = True
+        st.session_state.username = token_user
+
+# Logout revokes every token of this user on the server (the old URL may
+# have been bookmarked, logged or shared) and drops it from the URL
+def logout():
+    session_tokens.revoke(st.session_state.username)
+    if "session" in st.query_params:
+        del st.query_params["session"]
+    st.session_state.authenticated = False
+    st.session_state.username = ""
+    st.session_state.pop("history_cache", None)
+
+if st.session_state.authenticated and st.sidebar.button("Logout"):
+    logout()
+
 menu = st.sidebar.selectbox("Menu", ["Login", "Register", "Upload & Analyze", "History", "Download Report"])
 
 # Registration
@@ -95,10 +114,16 @@ if menu == "Register":
     user = st.text_input("Username")
     pw = st.text_input("Password", type="password")
     if st.button("Register"):
-        if register_user(user, pw):
-            st.success("User registered! Please login.")
+        if not valid_username(user):
+            st.error("Usernames may only contain letters, digits, '_', '-' and '.'.")
         else:
-            st.error("Username already exists or invalid input.")
+            registered = register_user(user, pw)
+            if registered is BUSY:
+                st.warning("The server is busy right now; please try again in a moment.")
+            elif registered:
+                st.success("User registered! Please login.")
+            else:
+                st.error("Username already exists or invalid input.")
 
 # Login
 elif menu == "Login":
@@ -106,9 +131,13 @@ elif menu == "Login":
     user = st.text_input("Username")
     pw = st.text_input("Password", type="password")
     if st.button("Login"):
-        if authenticate_user(user, pw):
+        ok = authenticate_user(user, pw)
+        if ok is BUSY:
+            st.warning("The server is busy right now; please try again in a moment.")
+        elif ok:
             st.session_state.authenticated = True
             st.session_state.username = user
+            st.query_params["session"] = session_tokens.issue(user_store, user)
             st.success("Logged in!")
         else:
             st.error("Invalid credentials.")
@@ -127,10 +156,10 @@ elif menu == "Upload & Analyze":
         file = st.file_uploader("Upload Scan", type=["png", "jpg", "jpeg"])
 
         if file:
-            filename = os.path.join("uploads", file.name)
-            with open(filename, "wb") as f:
-                f.write(file.getbuffer())
-            st.image(filename, caption="Uploaded Scan", use_column_width=True)
+            # Stored once per unique scan; reruns and re-uploads do not rewrite it
+            stored = upload_store.put_uploaded_file(file, patient=name)
+            # Downscaled preview, made once per unique scan
+            st.image(preview_store.for_upload(stored), caption="Uploaded Scan", use_column_width=True)
             result = "Possible abnormality detected in the frontal lobe."
             st.success("Scan processed.")
             st.info(result)
@@ -145,8 +174,12 @@ elif menu == "Upload & Analyze":
                 "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             }
 
-            save_history(st.session_state.username, str(record))
-            st.success("Entry saved securely.")
+            try:
+                save_history(st.session_state.username, record)
+                st.success("Entry saved securely.")
+            except Exception as exc:
+                st.error(f"The entry could not be saved yet ({exc or 'timed out'}). "
+                         "It is kept and will be retried automatically.")
 
 # View History
 elif menu == "History":
@@ -154,10 +187,17 @@ elif menu == "History":
         st.warning("Login required.")
     else:
         st.subheader("📜 Patient History")
-        records = get_history(st.session_state.username)
-        if records:
-            for entry in reversed(records):
+        history = get_history(st.session_state.username)
+        if len(history):
+            page_count = (len(history) + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+            page = st.number_input("Page", min_value=1, max_value=page_count, value=1)
+            for entry in history.page(page - 1, HISTORY_PAGE_SIZE):
                 st.json(entry)
+            st.caption(f"{len(history)} records · page {page} of {page_count}")
+            # One PDF per record, rendered in parallel and zipped in memory
+            if st.button("Generate all reports"):
+                st.download_button("📥 Download all reports (ZIP)", history_reports_zip(history.records()),
+                                   file_name=f"{st.session_state.username}_reports.zip", mime="application/zip")
         else:
             st.info("No history found.")
 
@@ -182,9 +222,9 @@ elif menu == "Download Report":
                 "Scan Type": scan_type,
                 "Physician": physician
             }
-            output_path = f"secure_data/{name.replace(' ', '_')}_report.pdf"
-            create_pdf(patient_info, diagnosis, output_path)
-            with open(output_path, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode()
-                dl_link = f'<a href="data:application/pdf;base64,{b64}" download="{name}_report.pdf">📥 Download PDF Report</a>'
-                st.markdown(dl_link, unsafe_allow_html=True)
+            # Rendered in memory (or reused if this exact report was rendered before)
+            st.download_button("📥 Download PDF Report", cached_report(patient_info, diagnosis),
+                               file_name=f"{name}_report.pdf", mime="application/pdf")
+            stats = report_cache().stats()
+            st.caption(f"Report cache: {stats['hits']} hits, {stats['misses']} misses, "
+                       f"{stats['size']} reports, {stats['bytes'] / 1024:.0f} KB")
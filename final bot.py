@@ -1,7 +1,10 @@
 import streamlit as st
 import os
 from datetime import date
-from PIL import Image
+from user_store import get_user_store
+from upload_store import get_upload_store
+from scan_previews import get_preview_store
+from brain_mesh import BRAIN_MESH_PATH, DEFAULT_LOD, LOD_LEVELS, mesh_figure
 
 # Set page config
 st.set_page_config(page_title="AI Brain Scan Chatbot", layout="centered")
@@ -9,24 +12,18 @@ st.set_page_config(page_title="AI Brain Scan Chatbot", layout="centered")
 # Upload folder
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+upload_store = get_upload_store(UPLOAD_FOLDER)
+preview_store = get_preview_store(UPLOAD_FOLDER)
 
 # Dummy file to store registered users and their passwords (in a real app, use a database)
 USER_FILE = "users.txt"
 
-# Function to load existing users from the file
-def load_users():
-    users = {}
-    if os.path.exists(USER_FILE):
-        with open(USER_FILE, "r") as file:
-            for line in file:
-                username, password = line.strip().split(":")
-                users[username] = password
-    return users
-
-# Function to register new users
+# Indexed view of the users file, kept in memory across reruns
+user_store = get_user_store(USER_FILE, sep=":")
+
+# Function to register new users (False if the name is taken)
 def register_user(username, password):
-    with open(USER_FILE, "a") as file:
-        file.write(f"{username}:{password}\n")
+    return user_store.add(username, password)
 
 # Session state to track login
 if "authenticated" not in st.session_state:
@@ -38,8 +35,7 @@ def login_form():
     username = st.text_input("Username")
     password = st.text_input("Password", type="password")
     if st.button("Login"):
-        users = load_users()
-        if username in users and users[username] == password:
+        if user_store.get(username) == password:
             st.session_state.authenticated = True
             st.success("Login successful!")
             st.experimental_rerun()
@@ -60,11 +56,9 @@ def registration_form():
         if password != confirm_password:
             st.error("Passwords do not match!")
         else:
-            users = load_users()
-            if username in users:
+            if not register_user(username, password):
                 st.error("Username already exists. Please choose another one.")
             else:
-                register_user(username, password)
                 st.success("Account created successfully! Please login.")
                 st.session_state.authenticated = False
                 st.experimental_rerun()
@@ -84,13 +78,12 @@ def brain_scan_app():
     uploaded_file = st.file_uploader("Upload a brain scan image (e.g., MRI, CT)", type=["png", "jpg", "jpeg"])
 
     if uploaded_file is not None:
-        filename = uploaded_file.name
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        with open(filepath, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        # Stored once per unique scan; reruns and re-uploads do not rewrite it
+        stored = upload_store.put_uploaded_file(uploaded_file, patient=patient_name)
 
         st.success("✅ Scan uploaded successfully!")
-        st.image(filepath, caption="Uploaded Brain Scan", use_column_width=True)
+        # Downscaled preview, made once per unique scan
+        st.image(preview_store.for_upload(stored), caption="Uploaded Brain Scan", use_column_width=True)
 
         st.markdown("---")
         st.subheader("🧠 Analysis Result")
@@ -129,12 +122,13 @@ def brain_scan_app():
         st.subheader("✅ Final Suggestion")
         st.success("Based on the scan, it's recommended to consult a neurologist for further evaluation.")
 
-        # 3D Brain Model (Static Image as Placeholder)
-        st.subheader("🧠 Brain Model Viewer (Illustrative)")
-        
-        # Load a placeholder brain model (use your own model images here)
-        brain_image = Image.open("path_to_3d_brain_image.png")  # Replace with the actual path to your 3D model image
-        st.image(brain_image, caption="3D Brain Model", use_column_width=True)
+        # 3D Brain Model Viewer: decimated levels of detail, parsed and serialized once per mesh
+        st.subheader("🧠 3D Brain Model Viewer")
+        if os.path.exists(BRAIN_MESH_PATH):
+            detail = st.select_slider("Level of detail", options=list(LOD_LEVELS), value=DEFAULT_LOD)
+            st.plotly_chart(mesh_figure(BRAIN_MESH_PATH, detail), use_container_width=True)
+        else:
+            st.info(f"No brain mesh found at {BRAIN_MESH_PATH} (OBJ, PLY or STL; set BRAIN_MESH_PATH).")
 
 # Run app
 if not st.session_state.authenticated:
@@ -1,9 +1,13 @@
 import streamlit as st
 import os
+from upload_store import get_upload_store
+from scan_previews import get_preview_store
 
 # Set upload directory
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+upload_store = get_upload_store(UPLOAD_FOLDER)
+preview_store = get_preview_store(UPLOAD_FOLDER)
 
 st.set_page_config(page_title="AI Brain Scan Chatbot", layout="centered")
 st.title("🧠 AI Chatbot for Brain Scan Analysis")
@@ -13,13 +17,12 @@ st.header("📤 Upload Brain Scan")
 uploaded_file = st.file_uploader("Upload a brain scan image (e.g., MRI, CT)", type=["png", "jpg", "jpeg"])
 
 if uploaded_file is not None:
-    filename = uploaded_file.name
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
-    with open(filepath, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+    # Stored once per unique scan; reruns and re-uploads do not rewrite it
+    stored = upload_store.put_uploaded_file(uploaded_file)
 
     st.success("✅ Scan uploaded successfully!")
-    st.image(filepath, caption="Uploaded Brain Scan", use_column_width=True)
+    # Downscaled preview, made once per unique scan
+    st.image(preview_store.for_upload(stored), caption="Uploaded Brain Scan", use_column_width=True)
 
     # Simulated brain scan analysis
     st.subheader("🧠 Analysis Result")
@@ -0,0 +1,276 @@
+# ----------------------------
+# model_registry.py – Process-Wide Model Registry
+# ----------------------------
+# Streamlit re-executes the app script on every widget interaction, but
+# imported modules are only initialised once per process. Models therefore
+# live here: each one is loaded on first use, warmed up with a dummy
+# inference and kept until the process exits or, for models registered with
+# an idle_timeout, until it has gone unused for that long.
+import ctypes
+import gc
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+import serving_config
+
+# Thread budget and backend from SERVING_CONFIG (if set), before any model library starts its pools
+serving_config.apply_if_configured()
+
+BRAIN_MODEL_PATH = 'saved_model/brain_diagnosis_model.h5'
+# Quantized exports written by quantize_model.py
+TFLITE_MODEL_PATHS = {
+    'int8': 'saved_model/brain_diagnosis_model_int8.tflite',
+    'float16': 'saved_model/brain_diagnosis_model_float16.tflite',
+    'dynamic': 'saved_model/brain_diagnosis_model_dynamic.tflite',
+}
+# Which brain CNN predict_scan serves: keras (the .h5 model), one of the
+# TFLite exports, or auto (the first export that exists, else keras)
+SCAN_MODEL_BACKEND = os.environ.get('SCAN_MODEL_BACKEND', 'keras')
+IMG_SIZE = 150
+
+_registry_lock = threading.Lock()
+_specs = {}
+_models = {}
+_load_locks = {}
+_info = {}
+_in_use = {}
+_last_used = {}
+# Loaded but not warmed up yet
+_cold = set()
+_reaper = None
+
+REAPER_INTERVAL = 30
+# gpt2 is only needed for generative replies; free it after this many idle seconds
+GPT2_IDLE_TIMEOUT = float(os.environ.get('GPT2_IDLE_TIMEOUT', 600))
+
+
+# Current resident set size of this process in bytes (None if unavailable)
+def resident_memory_bytes():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# Bytes held by a model's parameters (Keras models and transformers pipelines)
+def parameter_bytes(model):
+    if hasattr(model, 'model_bytes'):
+        return model.model_bytes
+    torch_model = getattr(model, 'model', None)
+    if torch_model is not None and hasattr(torch_model, 'parameters'):
+        return sum(p.numel() * p.element_size() for p in torch_model.parameters())
+    if hasattr(model, 'weights'):
+        # tf.DType under Keras 2, a dtype name string under Keras 3
+        return sum(int(np.prod(w.shape)) * np.dtype(getattr(w.dtype, 'as_numpy_dtype', w.dtype)).itemsize
+                   for w in model.weights)
+    return None
+
+
+# Register a loader under a name; re-registering an existing name is a no-op.
+# Models with an idle_timeout (seconds) are freed again once nobody has used
+# them for that long and reloaded transparently on the next call.
+def register(name, loader, warmup=None, idle_timeout=None):
+    with _registry_lock:
+        if name not in _specs:
+            _specs[name] = (loader, warmup, idle_timeout)
+            _load_locks[name] = threading.Lock()
+            _in_use[name] = 0
+
+
+# Return the named model, loading and warming it up on first use. With
+# warm=False the model is only loaded: no inference has run, so no library
+# thread pools exist yet and the process can still fork safely (see serve.py).
+# The next warm get() in each process runs the warmup.
+def get(name, warm=True):
+    model = _models.get(name)
+    if model is not None and not (warm and name in _cold):
+        _last_used[name] = time.monotonic()
+        return model
+    if name not in _specs:
+        raise KeyError(f"Unknown model: {name}")
+    # Per-model lock: loading gpt2 must not block a request for the CNN
+    with _load_locks[name]:
+        model = _models.get(name)
+        loader, warmup, idle_timeout = _specs[name]
+        if model is None:
+            rss_before = resident_memory_bytes()
+            start = time.perf_counter()
+            model = loader()
+            load_seconds = time.perf_counter() - start
+            rss_after = resident_memory_bytes()
+            _info[name] = {
+                "load_seconds": load_seconds,
+                "warmup_seconds": None,
+                "parameter_bytes": parameter_bytes(model),
+                "rss_before_bytes": rss_before,
+                "rss_after_bytes": rss_after,
+                "rss_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+                "loads": _info.get(name, {}).get("loads", 0) + 1,
+            }
+            _models[name] = model
+            _cold.add(name)
+            if idle_timeout is not None:
+                _start_reaper()
+        if warm and name in _cold:
+            if warmup is not None:
+                start = time.perf_counter()
+                warmup(model)
+                _info[name]["warmup_seconds"] = time.perf_counter() - start
+            _cold.discard(name)
+        _last_used[name] = time.monotonic()
+        return model
+
+
+def is_loaded(name):
+    return name in _models
+
+
+# Drop the named model so its memory can be reclaimed; returns False if it is in use
+def unload(name):
+    with _load_locks[name]:
+        with _registry_lock:
+            if _in_use[name] or name not in _models:
+                return False
+            del _models[name]
+        gc.collect()
+        _release_free_heap()
+        if name in _info:
+            _info[name]["rss_after_unload_bytes"] = resident_memory_bytes()
+        return True
+
+
+# Hand glibc's free arenas back to the OS so RSS actually drops after unload
+def _release_free_heap():
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+# Keep the named model loaded (and safe from the idle reaper) inside the block
+@contextmanager
+def hold(name):
+    with _registry_lock:
+        _in_use[name] += 1
+    try:
+        yield get(name)
+    finally:
+        with _registry_lock:
+            _in_use[name] -= 1
+        _last_used[name] = time.monotonic()
+
+
+# Lightweight stand-in that loads the model only when it is first called
+class LazyModel:
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, *args, **kwargs):
+        with hold(self.name) as model:
+            return model(*args, **kwargs)
+
+    def hold(self):
+        return hold(self.name)
+
+    def is_loaded(self):
+        return is_loaded(self.name)
+
+
+def lazy(name):
+    if name not in _specs:
+        raise KeyError(f"Unknown model: {name}")
+    return LazyModel(name)
+
+
+def _reap_idle_models():
+    while True:
+        time.sleep(REAPER_INTERVAL)
+        now = time.monotonic()
+        for name, (_, _, idle_timeout) in list(_specs.items()):
+            if idle_timeout is not None and name in _models and now - _last_used.get(name, now) > idle_timeout:
+                unload(name)
+
+
+def _start_reaper():
+    global _reaper
+    with _registry_lock:
+        if _reaper is None:
+            _reaper = threading.Thread(target=_reap_idle_models, name="model-reaper", daemon=True)
+            _reaper.start()
+
+
+# A forked child has no reaper thread; start its own if it holds reapable models
+def _after_fork_in_child():
+    global _reaper
+    _reaper = None
+    if any(_specs[name][2] is not None for name in _models):
+        _start_reaper()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+# Load time and memory footprint for every model loaded so far
+def stats():
+    return {name: dict(info, loaded=is_loaded(name)) for name, info in _info.items()}
+
+
+# ----------------------------
+# Default models used by the apps
+# ----------------------------
+def _load_brain_cnn():
+    from tensorflow.keras.models import load_model
+    # Inference only, so skip restoring the optimizer state
+    return load_model(BRAIN_MODEL_PATH, compile=False)
+
+def _warmup_brain_cnn(model):
+    model.predict_on_batch(np.zeros((1, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32))
+
+def _tflite_loader(mode):
+    def load():
+        from quantize_model import TFLiteModel
+        return TFLiteModel(TFLITE_MODEL_PATHS[mode])
+    return load
+
+# Registry name of the brain CNN for a backend (default: SCAN_MODEL_BACKEND)
+def scan_model_name(backend=None):
+    backend = backend or SCAN_MODEL_BACKEND
+    if backend == 'auto':
+        backend = next((mode for mode, path in TFLITE_MODEL_PATHS.items() if os.path.exists(path)), 'keras')
+    if backend == 'keras':
+        return 'brain_cnn'
+    if backend not in TFLITE_MODEL_PATHS:
+        raise ValueError(f"Unknown scan model backend {backend!r}")
+    return f'brain_cnn_{backend}'
+
+def _load_sentiment():
+    from transformers import pipeline
+    return pipeline('sentiment-analysis')
+
+def _warmup_sentiment(pipe):
+    pipe("warmup")
+
+def _load_gpt2():
+    from transformers import pipeline
+    return pipeline('text-generation', model='gpt2')
+
+def _warmup_gpt2(pipe):
+    pipe("Hello", max_new_tokens=1)
+
+
+register('brain_cnn', _load_brain_cnn, _warmup_brain_cnn)
+for _mode in TFLITE_MODEL_PATHS:
+    register(f'brain_cnn_{_mode}', _tflite_loader(_mode), _warmup_brain_cnn)
+register('sentiment', _load_sentiment, _warmup_sentiment)
+register('gpt2', _load_gpt2, _warmup_gpt2, idle_timeout=GPT2_IDLE_TIMEOUT)
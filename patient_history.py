@@ -0,0 +1,205 @@
+# ----------------------------
+# patient_history.py – Structured, Indexed Patient Scan History
+# ----------------------------
+# Records are stored one JSON object per line, so commas in names or
+# physician fields can no longer corrupt a row. An in-memory index keeps the
+# byte offset of every record plus the columns used for filtering; it is
+# extended incrementally from the bytes appended since the last read. A page
+# is read by seeking to its records' offsets, so rendering one page costs the
+# same however long the history grows. New records go through a group-commit
+# writer, so bursts of saves share one write (and one fsync).
+import bisect
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from append_log import FileTail, PerProcess, file_lock
+from batch_writer import get_writer
+
+FIELDS = ("name", "age", "scan_date", "scan_type", "physician", "result")
+_QUERY_CACHE_SIZE = 64
+
+
+def _contains(sorted_rows, row):
+    i = bisect.bisect_left(sorted_rows, row)
+    return i < len(sorted_rows) and sorted_rows[i] == row
+
+
+# Newest-first view of the first `count` rows of an ascending row list (the
+# list may keep growing). Slicing a page touches only that page's rows.
+class Rows:
+    def __init__(self, rows, count):
+        self._rows = rows
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._count)
+            if step != 1:
+                raise ValueError("Rows only supports contiguous slices")
+            return list(reversed(self._rows[self._count - stop:self._count - start])) if stop > start else []
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return self._rows[self._count - 1 - index]
+
+
+class PatientHistory:
+    def __init__(self, path, legacy_path=None, fsync=True):
+        self.path = path
+        self._lock = threading.Lock()
+        self._writer = get_writer(path, fsync=fsync)
+        self._tail = FileTail(path)
+        self._reset()
+        if legacy_path and os.path.exists(legacy_path) and not os.path.exists(path):
+            self._migrate(legacy_path)
+
+    def _reset(self):
+        self._offsets = []
+        self._dates = []
+        self._by_name = {}
+        self._by_type = {}
+        # Filter key -> ascending matching rows; extended as records arrive
+        self._queries = OrderedDict()
+
+    # One-time import of the old comma-separated patient_history.txt. Workers
+    # starting together may all get here; only the first to lock the new file
+    # while it is still empty writes the records.
+    def _migrate(self, legacy_path):
+        records = []
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if not line:
+                    continue
+                # name, age, date and type never contain commas in practice;
+                # the result is a fixed sentence, so the physician is whatever is left
+                head = line.split(",", 4)
+                if len(head) < 5:
+                    continue
+                physician, _, result = head[4].rpartition(",")
+                records.append(dict(zip(FIELDS, head[:4] + [physician, result])))
+        self.extend(records, if_empty=True)
+
+    @staticmethod
+    def encode(record):
+        return json.dumps({k: str(record.get(k, "")) for k in FIELDS}, ensure_ascii=False) + "\n"
+
+    # Queued for the background writer; visible to readers once flushed.
+    # Returns the writer's Future, which resolves once the record is on disk.
+    def append(self, record):
+        return self._writer.write(self.encode(record))
+
+    def flush(self, timeout=None):
+        return self._writer.flush(timeout)
+
+    # Synchronous bulk append (used for the one-time migration). With if_empty,
+    # nothing is written unless the file is still empty once locked.
+    def extend(self, records, if_empty=False):
+        if not records:
+            return False
+        with open(self.path, "a", encoding="utf-8") as f, file_lock(f):
+            if if_empty and os.fstat(f.fileno()).st_size:
+                return False
+            f.write("".join(self.encode(r) for r in records))
+            f.flush()
+        return True
+
+    # Index whatever has been appended since the last call; caller holds self._lock
+    def _refresh(self):
+        data, position, restarted = self._tail.read_new()
+        if restarted:
+            self._reset()
+        if not data:
+            return
+        for line in data.splitlines(keepends=True):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                position += len(line)
+                continue
+            row = len(self._offsets)
+            name, scan_type, scan_date = (record.get("name", "").strip().lower(), record.get("scan_type", ""),
+                                          record.get("scan_date", ""))
+            self._offsets.append(position)
+            self._dates.append(scan_date)
+            self._by_name.setdefault(name, []).append(row)
+            self._by_type.setdefault(scan_type, []).append(row)
+            for key, rows in self._queries.items():
+                if self._matches(key, name, scan_type, scan_date):
+                    rows.append(row)
+            position += len(line)
+
+    @staticmethod
+    def _matches(key, name, scan_type, scan_date):
+        want_name, want_type, date_from, date_to = key
+        return ((not want_name or name == want_name) and (not want_type or scan_type == want_type)
+                and (not date_from or scan_date >= date_from) and (not date_to or scan_date <= date_to))
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._offsets)
+
+    # Row numbers matching the filters, newest first, as a Rows view. The name
+    # match is exact but case-insensitive; dates are ISO strings (or date
+    # objects), inclusive. No filter, or just a name or just a type, is served
+    # straight from the index; other combinations are computed once and then
+    # kept up to date as records are appended.
+    def query(self, name=None, scan_type=None, date_from=None, date_to=None):
+        date_from = str(date_from) if date_from else None
+        date_to = str(date_to) if date_to else None
+        name = name.strip().lower() if name and name.strip() else None
+        key = (name, scan_type, date_from, date_to)
+        with self._lock:
+            self._refresh()
+            if not (date_from or date_to) and not (name and scan_type):
+                if name:
+                    rows = self._by_name.get(name, [])
+                elif scan_type:
+                    rows = self._by_type.get(scan_type, [])
+                else:
+                    rows = range(len(self._offsets))
+                return Rows(rows, len(rows))
+            rows = self._queries.get(key)
+            if rows is not None:
+                self._queries.move_to_end(key)
+                return Rows(rows, len(rows))
+            candidates = range(len(self._offsets))
+            if name and scan_type:
+                # Walk the shorter list, binary-search the longer one
+                small, large = sorted((self._by_name.get(name, []), self._by_type.get(scan_type, [])), key=len)
+                candidates = [r for r in small if _contains(large, r)]
+            elif name or scan_type:
+                candidates = self._by_name.get(name, []) if name else self._by_type.get(scan_type, [])
+            dates = self._dates
+            rows = [r for r in candidates
+                    if (not date_from or dates[r] >= date_from) and (not date_to or dates[r] <= date_to)]
+            self._queries[key] = rows
+            if len(self._queries) > _QUERY_CACHE_SIZE:
+                self._queries.popitem(last=False)
+            return Rows(rows, len(rows))
+
+    # Read just the records of one page (page numbers start at 0)
+    def page(self, rows, page, page_size=25):
+        with self._lock:
+            offsets = [self._offsets[r] for r in rows[page * page_size:(page + 1) * page_size]]
+        records = []
+        with open(self.path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                records.append(json.loads(f.readline()))
+        return records
+
+
+_histories = PerProcess(PatientHistory)
+
+
+# One history per file per process, so the index survives Streamlit reruns
+def get_patient_history(path, legacy_path=None):
+    return _histories.get(os.path.abspath(path), path, legacy_path)
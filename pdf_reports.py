@@ -0,0 +1,151 @@
+# ----------------------------
+# pdf_reports.py – In-Memory and Bulk PDF Reports
+# ----------------------------
+# Reports are rendered straight into bytes, so the app can hand them to the
+# browser without writing secure_data/<name>_report.pdf and reading it back.
+# Bulk mode renders many history records across a pool of worker processes
+# (PDF layout is pure Python and CPU bound, so threads would not help).
+# Rendered reports are cached by a hash of their contents, so downloading the
+# same report again does not lay it out again.
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from fpdf import FPDF
+
+from result_cache import get_cache
+
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', os.cpu_count() or 1))
+# Below this many reports, starting worker processes (~1s each) costs more than
+# it saves: one report takes a few milliseconds
+MIN_PARALLEL_REPORTS = 200
+REPORT_CACHE_MB = int(os.environ.get('REPORT_CACHE_MB', 32))
+
+# History record keys -> report fields
+HISTORY_FIELDS = {
+    "Patient Name": "Name",
+    "Age": "Age",
+    "Scan Date": "Scan Date",
+    "Scan Type": "Scan Type",
+    "Physician": "Physician",
+}
+
+
+def _build(patient_data, diagnosis):
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    pdf.cell(200, 10, "Brain Scan Diagnostic Report", ln=True, align='C')
+    pdf.ln(10)
+    for k, v in patient_data.items():
+        pdf.cell(200, 10, f"{k}: {v}", ln=True)
+    pdf.ln(5)
+    pdf.multi_cell(200, 10, f"Diagnosis:\n{diagnosis}")
+    return pdf
+
+
+# The finished PDF as bytes
+def render_report(patient_data, diagnosis):
+    return bytes(_build(patient_data, diagnosis).output())
+
+
+# Same fields (in the same order, which is the order they are printed) and
+# diagnosis -> same key
+def report_key(patient_data, diagnosis):
+    payload = json.dumps([[[str(k), str(v)] for k, v in patient_data.items()], str(diagnosis)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def report_cache():
+    return get_cache("pdf_reports", maxsize=1024, max_bytes=REPORT_CACHE_MB * 1024 * 1024)
+
+
+# render_report, served from the cache when the same report was rendered before
+def cached_report(patient_data, diagnosis):
+    cache = report_cache()
+    key = report_key(patient_data, diagnosis)
+    data = cache.get(key)
+    if data is None:
+        data = render_report(patient_data, diagnosis)
+        cache.put(key, data)
+    return data
+
+
+# Kept for callers that still want a file on disk
+def create_pdf(patient_data, diagnosis, output_path):
+    with open(output_path, "wb") as f:
+        f.write(render_report(patient_data, diagnosis))
+
+
+# (patient_data, diagnosis) for one saved history record
+def report_from_history(record):
+    patient_data = {field: record.get(key, "") for key, field in HISTORY_FIELDS.items()}
+    return patient_data, record.get("Diagnosis", "")
+
+
+def _render_job(job):
+    pdf = _build(*job)
+    return bytes(pdf.output()), pdf.pages_count
+
+
+# Worker processes _render_all actually uses for n_jobs reports (1 = serial)
+def _pool_size(n_jobs, workers, min_parallel=MIN_PARALLEL_REPORTS):
+    workers = min(workers or REPORT_WORKERS, n_jobs)
+    return 1 if workers <= 1 or n_jobs < min_parallel else workers
+
+
+def _render_all(jobs, workers, min_parallel=MIN_PARALLEL_REPORTS):
+    jobs = list(jobs)
+    workers = _pool_size(len(jobs), workers, min_parallel)
+    if workers == 1:
+        return [_render_job(job) for job in jobs]
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(_render_job, jobs, chunksize=chunksize))
+
+
+# Render many (patient_data, diagnosis) pairs in parallel; results keep input order
+def render_reports(jobs, workers=None):
+    return [data for data, _ in _render_all(jobs, workers)]
+
+
+# Reports for a list of history records, bundled into one in-memory ZIP
+def history_reports_zip(records, workers=None):
+    pdfs = render_reports([report_from_history(r) for r in records], workers)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for i, (record, data) in enumerate(zip(records, pdfs), 1):
+            name = str(record.get("Patient Name") or "patient").replace(" ", "_")
+            archive.writestr(f"{i:04d}_{name}_report.pdf", data)
+    return buffer.getvalue()
+
+
+# Pages/sec for one process versus the worker pool on synthetic records; the
+# pool is used whatever n_reports is, so small runs show the start-up cost
+def benchmark(n_reports=200, workers=None):
+    jobs = [({"Name": f"Patient {i}", "Age": 20 + i % 60, "Scan Date": "2024-01-01",
+              "Scan Type": "MRI", "Physician": "Dr. Smith"},
+             "Possible abnormality detected in the frontal lobe. " * (1 + i % 5))
+            for i in range(n_reports)]
+
+    def measure(n_workers):
+        start = time.perf_counter()
+        pages = sum(count for _, count in _render_all(jobs, n_workers, min_parallel=0))
+        elapsed = time.perf_counter() - start
+        return {"workers": _pool_size(len(jobs), n_workers, min_parallel=0), "pages": pages,
+                "seconds": elapsed, "pages_per_sec": pages / elapsed}
+
+    return {"serial": measure(1), "parallel": measure(workers or REPORT_WORKERS)}
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for name, result in benchmark(n).items():
+        print(f"{name}: {result['pages']} pages with {result['workers']} worker(s) in "
+              f"{result['seconds']:.2f}s ({result['pages_per_sec']:.1f} pages/sec)")
@@ -0,0 +1,222 @@
+# ----------------------------
+# preprocess_scans.py – One-Time Preprocessing into Memory-Mapped Shards
+# ----------------------------
+# Decodes and resizes every image under data/brain_mri once and writes uint8
+# NumPy shards plus an index.json label index per split. Training then
+# memory-maps the shards, so later epochs and reruns do no decode work.
+# Re-running only processes files whose mtime/size (and then hash) changed.
+#
+#   python preprocess_scans.py [--data-dir data/brain_mri] [--out-dir data/brain_mri_shards]
+import argparse
+import hashlib
+import json
+import math
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+IMG_SIZE = 150
+SHARD_SIZE = 1024
+DATA_DIR = 'data/brain_mri'
+SHARD_DIR = 'data/brain_mri_shards'
+SPLITS = ('train', 'val')
+INDEX_FILE = 'index.json'
+# Shards with fewer live rows than this are re-packed on the next build
+COMPACT_BELOW = 0.5
+
+# Same file layout and label order as flow_from_directory: one sub-directory
+# per class, classes indexed alphabetically, images found recursively
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.ppm', '.tif', '.tiff')
+
+
+def list_image_files(directory):
+    class_names = sorted(d for d in os.listdir(directory) if os.path.isdir(os.path.join(directory, d)))
+    paths, labels = [], []
+    for label, class_name in enumerate(class_names):
+        for root, _, files in sorted(os.walk(os.path.join(directory, class_name))):
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(root, name))
+                    labels.append(label)
+    return paths, labels, class_names
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_image(path, size=IMG_SIZE):
+    with Image.open(path) as img:
+        img.draft('RGB', (size, size))
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        return np.asarray(img.resize((size, size), Image.BILINEAR), dtype=np.uint8)
+
+
+def _load_index(out_dir):
+    try:
+        with open(os.path.join(out_dir, INDEX_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_index(out_dir, index):
+    path = os.path.join(out_dir, INDEX_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(path + ".tmp", path)
+
+
+def _write_shard(out_dir, index, images):
+    name = f"shard_{index['next_shard']:05d}.npy"
+    index['next_shard'] += 1
+    path = os.path.join(out_dir, name)
+    shard = np.lib.format.open_memmap(path + ".tmp", mode="w+", dtype=np.uint8, shape=(len(images), IMG_SIZE, IMG_SIZE, 3))
+    for row, image in enumerate(images):
+        shard[row] = image
+    shard.flush()
+    del shard
+    os.replace(path + ".tmp", path)
+    index['shards'][name] = {"rows": len(images), "live": len(images)}
+    return name
+
+
+# Bring one split's shards up to date with its source directory
+def build_shards(split_dir, out_dir, shard_size=SHARD_SIZE):
+    start = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    paths, labels, class_names = list_image_files(split_dir)
+    index = _load_index(out_dir)
+    if index is None or index.get('img_size') != IMG_SIZE or index.get('classes') != class_names:
+        # Label ids or image size changed: nothing in the old shards is reusable.
+        # The empty index is saved before the shards go, so it never names a deleted file.
+        old_shards = (index or {}).get('shards', {})
+        index = {"img_size": IMG_SIZE, "classes": class_names, "next_shard": 0, "shards": {}, "files": {}}
+        _save_index(out_dir, index)
+        for name in old_shards:
+            if os.path.exists(os.path.join(out_dir, name)):
+                os.remove(os.path.join(out_dir, name))
+    files = index['files']
+    # Shards left unreferenced by a build that crashed before deleting them
+    for name in os.listdir(out_dir):
+        if name.startswith('shard_') and name.endswith('.npy') and name not in index['shards']:
+            os.remove(os.path.join(out_dir, name))
+
+    def drop(rel):
+        entry = files.pop(rel)
+        index['shards'][entry['shard']]['live'] -= 1
+
+    counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+    pending = []
+    seen = set()
+    for path, label in zip(paths, labels):
+        rel = os.path.relpath(path, split_dir)
+        seen.add(rel)
+        stat = os.stat(path)
+        entry = files.get(rel)
+        if entry is not None and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            counts['unchanged'] += 1
+            continue
+        digest = file_digest(path)
+        if entry is not None and entry['sha256'] == digest:
+            # Touched but not modified: no need to decode again
+            entry['mtime_ns'] = stat.st_mtime_ns
+            counts['unchanged'] += 1
+            continue
+        if entry is not None:
+            drop(rel)
+            counts['updated'] += 1
+        else:
+            counts['added'] += 1
+        pending.append((rel, path, label, stat, digest))
+    for rel in [rel for rel in files if rel not in seen]:
+        drop(rel)
+        counts['removed'] += 1
+
+    # Re-pack mostly-dead shards from their existing pixels (no decoding)
+    replaced = []
+    for name, shard in list(index['shards'].items()):
+        if shard['live'] == 0 or shard['live'] < shard['rows'] * COMPACT_BELOW:
+            live = sorted((entry['row'], rel) for rel, entry in files.items() if entry['shard'] == name)
+            if live:
+                old = np.load(os.path.join(out_dir, name), mmap_mode='r')
+                new_name = _write_shard(out_dir, index, [old[row] for row, _ in live])
+                del old
+                for new_row, (_, rel) in enumerate(live):
+                    files[rel]['shard'], files[rel]['row'] = new_name, new_row
+            del index['shards'][name]
+            replaced.append(name)
+    if replaced:
+        # Point the index at the re-packed shards before deleting the old ones;
+        # a crash in between only leaves unreferenced files (swept next build)
+        _save_index(out_dir, index)
+        for name in replaced:
+            os.remove(os.path.join(out_dir, name))
+
+    for chunk_start in range(0, len(pending), shard_size):
+        chunk = pending[chunk_start:chunk_start + shard_size]
+        name = _write_shard(out_dir, index, [load_image(path) for _, path, _, _, _ in chunk])
+        for row, (rel, _, label, stat, digest) in enumerate(chunk):
+            files[rel] = {"label": label, "shard": name, "row": row,
+                          "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": digest}
+
+    _save_index(out_dir, index)
+    counts['seconds'] = time.perf_counter() - start
+    return counts
+
+
+# Memory-mapped view over a split's shards that yields float32 training batches
+class ShardedDataset:
+    def __init__(self, out_dir, batch_size=32, shuffle=False, seed=None):
+        index = _load_index(out_dir)
+        if index is None:
+            raise FileNotFoundError(f"No {INDEX_FILE} in {out_dir}; run preprocess_scans.py first")
+        self.class_names = index['classes']
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self._rng = np.random.default_rng(seed)
+        self._shards = {name: np.load(os.path.join(out_dir, name), mmap_mode='r') for name in index['shards']}
+        shard_ids = {name: i for i, name in enumerate(self._shards)}
+        self._arrays = list(self._shards.values())
+        entries = sorted((shard_ids[e['shard']], e['row'], e['label']) for e in index['files'].values())
+        table = np.array(entries, dtype=np.int64).reshape(-1, 3)
+        self.shard_ids, self.rows, self.labels = table[:, 0], table[:, 1], table[:, 2].astype(np.float32)
+
+    def __len__(self):
+        return math.ceil(len(self.rows) / self.batch_size)
+
+    @property
+    def num_images(self):
+        return len(self.rows)
+
+    # One pass over the data; reshuffled on every call when shuffle=True
+    def batches(self):
+        order = self._rng.permutation(len(self.rows)) if self.shuffle else np.arange(len(self.rows))
+        for start in range(0, len(order), self.batch_size):
+            # Sorting the batch by (shard, row) keeps page-cache reads sequential
+            batch = np.sort(order[start:start + self.batch_size])
+            x = np.empty((len(batch), IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+            for shard_id in np.unique(self.shard_ids[batch]):
+                mask = self.shard_ids[batch] == shard_id
+                x[mask] = self._arrays[shard_id][self.rows[batch[mask]]]
+            x *= 1.0 / 255
+            yield x, self.labels[batch]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Preprocess brain MRI images into memory-mapped uint8 shards")
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--out-dir', default=SHARD_DIR)
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE)
+    args = parser.parse_args()
+    for split in SPLITS:
+        counts = build_shards(os.path.join(args.data_dir, split), os.path.join(args.out_dir, split), args.shard_size)
+        print(f"{split}: {counts['added']} added, {counts['updated']} updated, {counts['removed']} removed, "
+              f"{counts['unchanged']} unchanged in {counts['seconds']:.1f}s")
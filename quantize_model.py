@@ -0,0 +1,195 @@
+# ----------------------------
+# quantize_model.py – Quantized TFLite Export of the Brain CNN
+# ----------------------------
+# Converts saved_model/brain_diagnosis_model.h5 into TFLite flatbuffers for
+# CPU serving:
+#   int8     full-integer weights and activations, calibrated on a
+#            representative sample of training scans (smallest, fastest)
+#   float16  half-precision weights (half the size, no calibration needed)
+#   dynamic  int8 weights, float activations
+# Inputs and outputs stay float32, so the app's preprocessing is unchanged.
+# TFLiteModel wraps an exported file with the same predict_on_batch call as
+# the Keras model; model_registry serves it when SCAN_MODEL_BACKEND is set.
+#
+#   python quantize_model.py export [--mode int8|float16|dynamic]
+#   python quantize_model.py compare      (accuracy delta, latency and size on the val split)
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from model_registry import BRAIN_MODEL_PATH, TFLITE_MODEL_PATHS
+from preprocess_scans import list_image_files
+from scan_preprocessing import preprocess_images
+
+DATA_DIR = 'data/brain_mri'
+CALIBRATION_SAMPLES = 200
+TFLITE_THREADS = int(os.environ.get('TFLITE_THREADS', 0)) or None
+
+
+def _interpreter_class():
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:  # older TensorFlow ships the interpreter itself
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+# Runs an exported .tflite file like a Keras model (predict_on_batch only).
+# The interpreter is not thread-safe, so calls are serialised; the batching
+# server already funnels concurrent requests into one call anyway. Each
+# process builds its own interpreter on first use: the file is memory-mapped,
+# so forked serving workers share one copy of the weights in the page cache,
+# and no interpreter thread pool is inherited across fork().
+class TFLiteModel:
+    def __init__(self, path, num_threads=TFLITE_THREADS):
+        self.path = path
+        self.num_threads = num_threads
+        # Reported by model_registry.parameter_bytes
+        self.model_bytes = os.path.getsize(path)
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _interpreter_for_process(self):
+        if self._pid != os.getpid():
+            self._interpreter = _interpreter_class()(model_path=self.path, num_threads=self.num_threads)
+            self._interpreter.allocate_tensors()
+            self._input = self._interpreter.get_input_details()[0]
+            self._output = self._interpreter.get_output_details()[0]
+            self._batch_size = int(self._input['shape'][0])
+            self._pid = os.getpid()
+        return self._interpreter
+
+    def predict_on_batch(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        with self._lock:
+            interpreter = self._interpreter_for_process()
+            if batch.shape[0] != self._batch_size:
+                interpreter.resize_tensor_input(self._input['index'], batch.shape)
+                interpreter.allocate_tensors()
+                self._batch_size = batch.shape[0]
+            interpreter.set_tensor(self._input['index'], batch)
+            interpreter.invoke()
+            return interpreter.get_tensor(self._output['index']).copy()
+
+
+def _representative_dataset(data_dir, samples):
+    paths, _, _ = list_image_files(data_dir)
+    paths = random.Random(0).sample(paths, min(samples, len(paths)))
+
+    def generate():
+        for path in paths:
+            yield [preprocess_images([path])]
+    return generate
+
+
+# A TFLite converter for `model`, valid inside the with block
+@contextmanager
+def _converter(model):
+    import tensorflow as tf
+    try:
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    except Exception:
+        converter = None
+    if converter is not None:
+        yield converter
+        return
+    # Keras 3 models convert through an exported SavedModel instead, which is
+    # removed again once the conversion is done
+    with tempfile.TemporaryDirectory(prefix='brain_cnn_savedmodel_') as export_dir:
+        model.export(export_dir)
+        yield tf.lite.TFLiteConverter.from_saved_model(export_dir)
+
+
+def export(mode='int8', model_path=BRAIN_MODEL_PATH, out_path=None, data_dir=os.path.join(DATA_DIR, 'train'),
+           calibration_samples=CALIBRATION_SAMPLES):
+    import tensorflow as tf
+    from tensorflow.keras.models import load_model
+
+    if mode not in ('int8', 'float16', 'dynamic'):
+        raise ValueError(f"Unknown quantization mode {mode!r}")
+    with _converter(load_model(model_path, compile=False)) as converter:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if mode == 'int8':
+            converter.representative_dataset = _representative_dataset(data_dir, calibration_samples)
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        elif mode == 'float16':
+            converter.target_spec.supported_types = [tf.float16]
+        data = converter.convert()
+    out_path = out_path or TFLITE_MODEL_PATHS[mode]
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    with open(out_path, 'wb') as f:
+        f.write(data)
+    return out_path
+
+
+def _evaluate(model, batch, labels, repeat=20):
+    probabilities = np.asarray(model.predict_on_batch(batch)).reshape(-1)
+    accuracy = float(np.mean((probabilities > 0.5) == labels))
+    one = batch[:1]
+    model.predict_on_batch(one)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        model.predict_on_batch(one)
+    single_ms = (time.perf_counter() - start) * 1000 / repeat
+    start = time.perf_counter()
+    for i in range(0, len(batch), 32):
+        model.predict_on_batch(batch[i:i + 32])
+    batched_ms = (time.perf_counter() - start) * 1000 / len(batch)
+    return probabilities, {"accuracy": accuracy, "ms_single": single_ms, "ms_per_image_batched": batched_ms}
+
+
+# Accuracy, latency and size of each available export against the Keras model
+def compare(model_path=BRAIN_MODEL_PATH, data_dir=os.path.join(DATA_DIR, 'val'), modes=('int8', 'float16', 'dynamic')):
+    from tensorflow.keras.models import load_model
+
+    paths, labels, _ = list_image_files(data_dir)
+    labels = np.asarray(labels)
+    batch = preprocess_images(paths)
+    reference, base = _evaluate(load_model(model_path, compile=False), batch, labels)
+    results = {"keras": dict(base, size_mb=os.path.getsize(model_path) / 2**20, accuracy_delta=0.0, agreement=1.0)}
+    for mode in modes:
+        path = TFLITE_MODEL_PATHS[mode]
+        if not os.path.exists(path):
+            continue
+        probabilities, result = _evaluate(TFLiteModel(path), batch, labels)
+        result.update(size_mb=os.path.getsize(path) / 2**20,
+                      accuracy_delta=result["accuracy"] - base["accuracy"],
+                      agreement=float(np.mean((probabilities > 0.5) == (reference > 0.5))),
+                      max_abs_diff=float(np.max(np.abs(probabilities - reference))))
+        results[mode] = result
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export and compare quantized versions of the brain CNN")
+    sub = parser.add_subparsers(dest='command', required=True)
+    exp = sub.add_parser('export')
+    exp.add_argument('--mode', choices=sorted(TFLITE_MODEL_PATHS), default='int8')
+    exp.add_argument('--model', default=BRAIN_MODEL_PATH)
+    exp.add_argument('--output', default=None)
+    exp.add_argument('--data-dir', default=os.path.join(DATA_DIR, 'train'), help="calibration images (int8)")
+    exp.add_argument('--samples', type=int, default=CALIBRATION_SAMPLES)
+    cmp = sub.add_parser('compare')
+    cmp.add_argument('--model', default=BRAIN_MODEL_PATH)
+    cmp.add_argument('--data-dir', default=os.path.join(DATA_DIR, 'val'))
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        path = export(args.mode, args.model, args.output, args.data_dir, args.samples)
+        print(f"Wrote {path} ({os.path.getsize(path) / 2**20:.2f} MB)")
+    else:
+        print(f"{'model':<9} {'size MB':>8} {'accuracy':>9} {'delta':>7} {'agree':>6} {'ms/img 1':>9} {'ms/img 32':>10}")
+        for name, r in compare(args.model, args.data_dir).items():
+            print(f"{name:<9} {r['size_mb']:8.2f} {r['accuracy']:9.3f} {r['accuracy_delta']:+7.3f} "
+                  f"{r['agreement']:6.3f} {r['ms_single']:9.2f} {r['ms_per_image_batched']:10.2f}")
+
+
+if __name__ == '__main__':
+    main()
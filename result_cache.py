@@ -0,0 +1,103 @@
+# ----------------------------
+# result_cache.py – Bounded LRU/TTL Cache for Model Results
+# ----------------------------
+# Named caches are kept at module level so they survive Streamlit reruns,
+# the same way model_registry keeps the models themselves. Caches of large
+# values (e.g. rendered PDFs) can also be bounded by their total size in
+# bytes, as measured by a `sizeof` function.
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=None, max_bytes=None, sizeof=len):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    # Return the cached value, or `default` on a miss or expired entry
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at, size = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.nbytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[2]
+            # A value larger than the whole budget is not cached at all
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._data[key] = (value, expires_at, size)
+            self.nbytes += size
+            while len(self._data) > self.maxsize or (self.max_bytes is not None and self.nbytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Process-wide cache by name; settings only apply when the cache is first created
+def get_cache(name, maxsize=1024, ttl=None, max_bytes=None, sizeof=len):
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = _caches[name] = LRUCache(maxsize=maxsize, ttl=ttl, max_bytes=max_bytes, sizeof=sizeof)
+        return cache
+
+
+# Cache key for free text: case and whitespace differences map to the same entry
+def normalize_text(text):
+    return " ".join(text.split()).lower()
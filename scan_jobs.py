@@ -0,0 +1,162 @@
+# ----------------------------
+# scan_jobs.py – Background Scan Analysis Jobs
+# ----------------------------
+# /scan only stores the upload and enqueues a job; inference runs in a pool
+# of worker processes, separate from the web server's request threads. Job
+# state lives in one JSON file per job under jobs/, written by the worker
+# itself, so any web worker process can answer status requests for any job.
+# With SCAN_JOB_EXECUTOR=thread (see serving.ini) jobs run on threads inside
+# the web worker instead, sharing the model that serve.py preloaded before forking.
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import serving_config
+
+serving_config.apply_if_configured()
+
+JOB_DIR = 'jobs'
+# Keras models are not safe to call from several threads at once (executor = thread)
+_predict_lock = threading.Lock()
+SCAN_WORKERS = int(os.environ.get('SCAN_WORKERS', 2))
+SCAN_JOB_EXECUTOR = os.environ.get('SCAN_JOB_EXECUTOR', 'process')
+_JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+FINDINGS = {
+    True: {
+        "analysis": "Detected possible abnormality in frontal lobe.",
+        "report": "The scan shows mild abnormalities that could indicate early signs of neurological issues.",
+        "medical_info": "This condition may relate to early-stage dementia or a benign tumor.",
+        "human_info": "There might be an issue in the brain’s front part, which affects planning and decision-making.",
+        "result": "We recommend consulting a neurologist for further examination.",
+    },
+    False: {
+        "analysis": "No abnormality detected.",
+        "report": "The scan shows no signs of a tumor or other abnormalities.",
+        "medical_info": "No findings that suggest a tumor were detected in this scan.",
+        "human_info": "Your scan looks normal; nothing unusual was found.",
+        "result": "No further examination is needed unless symptoms persist.",
+    },
+}
+
+
+def _job_path(job_dir, job_id):
+    return os.path.join(job_dir, f"{job_id}.json")
+
+
+def _write_status(job_dir, job_id, status):
+    path = _job_path(job_dir, job_id)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(status, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+# Runs in a worker process; the model is loaded once per worker by the registry
+def analyze_scan(scan_path):
+    import model_registry
+    from scan_preprocessing import preprocess_images
+
+    batch = preprocess_images([scan_path])
+    model = model_registry.get(model_registry.scan_model_name())
+    with _predict_lock:
+        probability = float(model.predict_on_batch(batch)[0][0])
+    return dict(FINDINGS[probability > 0.5], probability=probability)
+
+
+def _run_job(job_dir, scan_path, job):
+    status = dict(job, status="running", started_at=time.time())
+    _write_status(job_dir, job["job_id"], status)
+    try:
+        status.update(status="done", **analyze_scan(scan_path))
+    except Exception as exc:
+        status.update(status="failed", error=f"{type(exc).__name__}: {exc}")
+    status["finished_at"] = time.time()
+    _write_status(job_dir, job["job_id"], status)
+
+
+class ScanJobQueue:
+    def __init__(self, job_dir=JOB_DIR, workers=SCAN_WORKERS, executor=SCAN_JOB_EXECUTOR):
+        if executor not in ("process", "thread"):
+            raise ValueError(f"Unknown job executor {executor!r}")
+        self.job_dir = job_dir
+        self.workers = workers
+        self.executor = executor
+        self._pool = None
+        self._lock = threading.Lock()
+        os.makedirs(job_dir, exist_ok=True)
+
+    # Created on first use (so never before serve.py forks); "spawn" keeps
+    # TensorFlow out of a forked, multi-threaded parent
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                if self.executor == "thread":
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scan-job")
+                else:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    # A process pool whose worker died stays broken; drop it so the next
+    # submit builds a new one
+    def _discard_pool(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _fail(self, job, exc):
+        _write_status(self.job_dir, job["job_id"], dict(job, status="failed", error=f"{type(exc).__name__}: {exc}"))
+
+    def submit(self, scan_path, **details):
+        job = dict(details, job_id=uuid.uuid4().hex, submitted_at=time.time())
+        _write_status(self.job_dir, job["job_id"], dict(job, status="queued"))
+        for attempt in range(2):
+            pool = self._get_pool()
+            try:
+                future = pool.submit(_run_job, self.job_dir, scan_path, job)
+            except BrokenProcessPool as exc:
+                self._discard_pool(pool)
+                if attempt:
+                    self._fail(job, exc)
+                continue
+            except RuntimeError as exc:  # shut down
+                self._fail(job, exc)
+                break
+            future.add_done_callback(lambda f: self._record_crash(f, job, pool))
+            break
+        return job["job_id"]
+
+    # A worker that dies (e.g. out of memory) never writes its own failure
+    def _record_crash(self, future, job, pool):
+        if future.cancelled():
+            self._fail(job, RuntimeError("Job was cancelled"))
+            return
+        exc = future.exception()
+        if exc is not None:
+            self._fail(job, exc)
+            if isinstance(exc, BrokenProcessPool):
+                self._discard_pool(pool)
+
+    # Current status of a job, or None if the id is unknown
+    def get(self, job_id):
+        if not job_id or not _JOB_ID.match(job_id):
+            return None
+        try:
+            with open(_job_path(self.job_dir, job_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait)
+                self._pool = None
@@ -0,0 +1,100 @@
+# ----------------------------
+# scan_preprocessing.py – Batch Image Preprocessing for the Brain CNN
+# ----------------------------
+# Turns PIL images, raw bytes, file objects or paths into one contiguous
+# float32 (n, 150, 150, 3) batch. JPEGs are downscaled while decoding (draft
+# mode), colour modes are converted once, and each image is scaled straight
+# into its slot of the output array, so there is no float64 intermediate.
+#
+#   python scan_preprocessing.py scan1.jpg scan2.png ...   (micro-benchmark)
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+IMG_SIZE = 150
+_SCALE = np.float32(1.0 / 255)
+
+
+def _open_image(source):
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+    # Paths and file-like objects (e.g. Streamlit's UploadedFile)
+    return Image.open(source)
+
+
+# 16-bit / float scans: stretch to 8 bits instead of letting convert() clip
+def to_8bit(img):
+    if img.mode not in ('I', 'I;16', 'I;16B', 'I;16L', 'F'):
+        return img
+    pixels = np.asarray(img, dtype=np.float32)
+    peak = pixels.max()
+    pixels *= 255.0 / peak if peak > 0 else 0.0
+    return Image.fromarray(pixels.astype(np.uint8), mode='L')
+
+
+# Decode and resize one image to an RGB PIL image of size x size
+def prepare_image(source, size=IMG_SIZE):
+    img = _open_image(source)
+    # Only has an effect on JPEGs that are not decoded yet: the decoder then
+    # produces a 1/2, 1/4 or 1/8 scale image that is still at least `size`
+    img.draft('RGB', (size, size))
+    img = to_8bit(img)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if img.size != (size, size):
+        img = img.resize((size, size), Image.BILINEAR, reducing_gap=2.0)
+    return img
+
+
+# Preprocess a list of images into one C-contiguous float32 batch in [0, 1]
+def preprocess_images(sources, size=IMG_SIZE, out=None):
+    if out is None:
+        out = np.empty((len(sources), size, size, 3), dtype=np.float32)
+    for i, source in enumerate(sources):
+        np.multiply(np.asarray(prepare_image(source, size)), _SCALE, out=out[i])
+    return out
+
+
+# The preprocessing predict_scan used before, kept for comparison
+def _legacy_preprocess(source, size=IMG_SIZE):
+    img = _open_image(source).resize((size, size))
+    return np.expand_dims(np.array(img) / 255.0, axis=0)
+
+
+# Per-image time and peak traced (NumPy/Python) memory of both paths
+def benchmark(sources, repeat=5):
+    data = []
+    for source in sources:
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                source = f.read()
+        data.append(source)
+
+    def measure(fn):
+        tracemalloc.start()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {"ms_per_image": elapsed * 1000 / (repeat * len(data)), "peak_mb": peak / 2**20}
+
+    return {
+        "legacy": measure(lambda: np.concatenate([_legacy_preprocess(d) for d in data])),
+        "batched": measure(lambda: preprocess_images(data)),
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit("usage: python scan_preprocessing.py IMAGE [IMAGE ...]")
+    for name, result in benchmark(sys.argv[1:]).items():
+        print(f"{name}: {result['ms_per_image']:.2f} ms/image, peak {result['peak_mb']:.1f} MB")
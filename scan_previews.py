@@ -0,0 +1,128 @@
+# ----------------------------
+# scan_previews.py – Downscaled Previews for Uploaded Scans
+# ----------------------------
+# The UI shows a small, compressed JPEG preview instead of shipping the
+# full-resolution upload to the browser on every rerun. A preview is made
+# once per unique scan, stored next to the uploads under its SHA-256:
+#   uploads/previews/ab/abcd...ef_800.jpg
+# and recently used previews are also kept in memory. Originals are only
+# decoded for analysis.
+#
+#   python scan_previews.py scan1.png scan2.jpg ...   (size / time comparison)
+import hashlib
+import io
+import os
+import sys
+import threading
+import time
+
+from PIL import Image
+
+from append_log import PerProcess
+from result_cache import LRUCache
+from scan_preprocessing import to_8bit
+
+PREVIEWS_DIR = "previews"
+PREVIEW_MAX_SIDE = int(os.environ.get("PREVIEW_MAX_SIDE", 800))
+PREVIEW_QUALITY = 80
+PREVIEW_CACHE_MB = 16
+
+
+# Encode a downscaled JPEG preview of an image (path, bytes or file object)
+def make_preview(source, max_side=PREVIEW_MAX_SIDE, quality=PREVIEW_QUALITY):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    img = Image.open(source)
+    # JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale when that is big enough
+    img.draft("RGB", (max_side, max_side))
+    img = to_8bit(img)
+    # Greyscale scans stay one-channel, which keeps the JPEG small
+    if "A" in img.getbands() or "transparency" in img.info:
+        # JPEG has no alpha: flatten onto white
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        img = background
+    elif img.mode not in ("L", "RGB"):
+        img = img.convert("RGB")
+    img.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=2.0)
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+class PreviewStore:
+    def __init__(self, root="uploads", max_side=PREVIEW_MAX_SIDE):
+        self.root = root
+        self.max_side = max_side
+        self._memory = LRUCache(maxsize=256, max_bytes=PREVIEW_CACHE_MB * 1024 * 1024)
+
+    def path(self, digest):
+        return os.path.join(self.root, PREVIEWS_DIR, digest[:2], f"{digest}_{self.max_side}.jpg")
+
+    # Preview bytes for the scan with this digest; `source` (the original) is
+    # only read when no preview exists yet
+    def get(self, digest, source):
+        data = self._memory.get(digest)
+        if data is not None:
+            return data
+        path = self.path(digest)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = make_preview(source, self.max_side)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        self._memory.put(digest, data)
+        return data
+
+    # Preview of an upload_store.StoredUpload
+    def for_upload(self, stored):
+        return self.get(stored.digest, stored.path)
+
+    # Preview of raw image bytes that are not in the upload store
+    def for_bytes(self, data):
+        return self.get(hashlib.sha256(data).hexdigest(), data)
+
+
+_stores = PerProcess(PreviewStore)
+
+
+# One store per upload folder per process, so the memory cache survives Streamlit reruns
+def get_preview_store(root="uploads"):
+    return _stores.get(os.path.abspath(root), root)
+
+
+# Bytes shipped and time to produce the displayed image: original vs preview
+def benchmark(paths, max_side=PREVIEW_MAX_SIDE):
+    results = []
+    for path in paths:
+        with open(path, "rb") as f:
+            original = f.read()
+        start = time.perf_counter()
+        Image.open(io.BytesIO(original)).load()
+        original_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        preview = make_preview(original, max_side)
+        build_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        Image.open(io.BytesIO(preview)).load()
+        preview_ms = (time.perf_counter() - start) * 1000
+        results.append({"path": path, "original_bytes": len(original), "preview_bytes": len(preview),
+                        "original_decode_ms": original_ms, "preview_decode_ms": preview_ms,
+                        "build_ms": build_ms})
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit("usage: python scan_previews.py IMAGE [IMAGE ...]")
+    for r in benchmark(sys.argv[1:]):
+        print(f"{r['path']}: {r['original_bytes'] / 1024:.0f} KB -> {r['preview_bytes'] / 1024:.0f} KB "
+              f"({r['original_bytes'] / r['preview_bytes']:.0f}x smaller), decode "
+              f"{r['original_decode_ms']:.1f} ms -> {r['preview_decode_ms']:.1f} ms "
+              f"(built once in {r['build_ms']:.1f} ms)")
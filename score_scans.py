@@ -0,0 +1,264 @@
+# ----------------------------
+# score_scans.py – Offline Bulk Scan Scoring
+# ----------------------------
+# Scores every image under a directory tree with the brain CNN that
+# predict_scan uses. Images are decoded and resized in a pool of worker
+# processes (the same preprocessing as the app), a bounded number of chunks
+# is kept in flight so decoding overlaps inference, and the model sees large
+# batches. Results are written batch by batch to CSV or Parquet; re-running
+# the same command after a crash skips every image that already has a row.
+#
+#   python score_scans.py archive/ --output scores.csv [--batch-size 256] [--workers 4]
+#   python score_scans.py archive/ --output scores.parquet      (needs pyarrow)
+import argparse
+import csv
+import glob
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from model_registry import BRAIN_MODEL_PATH
+from preprocess_scans import IMAGE_EXTENSIONS
+from scan_preprocessing import IMG_SIZE, prepare_image
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional
+    pa = pq = None
+
+COLUMNS = ["path", "probability", "label", "error"]
+DEFAULT_BATCH_SIZE = 256
+# Images per task sent to a decode worker
+CHUNK_SIZE = 64
+
+
+def list_scans(root):
+    paths = []
+    for dirpath, dirnames, files in os.walk(root):
+        dirnames.sort()
+        paths.extend(os.path.join(dirpath, name) for name in sorted(files) if name.lower().endswith(IMAGE_EXTENSIONS))
+    return paths
+
+
+# Runs in a worker process: uint8 pixels (4x less to send back than float32)
+def _decode_chunk(paths, size=IMG_SIZE):
+    images = np.zeros((len(paths), size, size, 3), dtype=np.uint8)
+    errors = [None] * len(paths)
+    for i, path in enumerate(paths):
+        try:
+            images[i] = np.asarray(prepare_image(path, size))
+        except Exception as exc:
+            errors[i] = f"{type(exc).__name__}: {exc}"
+    return paths, images, errors
+
+
+# Rows are appended and flushed batch by batch; on restart the rows already
+# in the file tell us which images are done
+class CsvSink:
+    def __init__(self, path):
+        self.path = path
+        self._repair()
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        if new:
+            self._writer.writerow(COLUMNS)
+
+    # Drop a half-written last line left by a crash
+    def _repair(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def done_paths(self):
+        with open(self.path, newline="", encoding="utf-8") as f:
+            return {row["path"] for row in csv.DictReader(f)}
+
+    def write(self, rows):
+        self._writer.writerows([[r[c] for c in COLUMNS] for r in rows])
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+# Each batch becomes one part file under <output>.parts/ (written atomically);
+# the parts are merged into the output file once every image is scored
+class ParquetSink:
+    def __init__(self, path):
+        if pq is None:
+            sys.exit("Parquet output needs pyarrow (pip install pyarrow), or use a .csv output")
+        self.path = path
+        self.parts_dir = path + ".parts"
+        os.makedirs(self.parts_dir, exist_ok=True)
+        self.schema = pa.schema([("path", pa.string()), ("probability", pa.float32()),
+                                 ("label", pa.string()), ("error", pa.string())])
+        self._parts = sorted(glob.glob(os.path.join(self.parts_dir, "part-*.parquet")))
+
+    def done_paths(self):
+        done = set()
+        for part in self._parts:
+            done.update(pq.read_table(part, columns=["path"]).column("path").to_pylist())
+        if os.path.exists(self.path):
+            done.update(pq.read_table(self.path, columns=["path"]).column("path").to_pylist())
+        return done
+
+    def write(self, rows):
+        table = pa.Table.from_pydict({c: [r[c] for r in rows] for c in COLUMNS}, schema=self.schema)
+        part = os.path.join(self.parts_dir, f"part-{len(self._parts):06d}.parquet")
+        pq.write_table(table, part + ".tmp")
+        os.replace(part + ".tmp", part)
+        self._parts.append(part)
+
+    def close(self):
+        if not self._parts:
+            return
+        tables = [pq.read_table(p) for p in self._parts]
+        if os.path.exists(self.path):
+            tables.insert(0, pq.read_table(self.path))
+        pq.write_table(pa.concat_tables(tables), self.path + ".tmp")
+        os.replace(self.path + ".tmp", self.path)
+        for part in self._parts:
+            os.remove(part)
+        os.rmdir(self.parts_dir)
+
+
+def open_sink(path):
+    return ParquetSink(path) if path.lower().endswith(".parquet") else CsvSink(path)
+
+
+def _label(probability, threshold):
+    return 'Tumor Detected' if probability > threshold else 'No Tumor Detected'
+
+
+class StageTimer:
+    def __init__(self):
+        self.seconds = {}
+
+    def add(self, stage, start):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - start
+
+
+def score(root, output, model_path=BRAIN_MODEL_PATH, batch_size=DEFAULT_BATCH_SIZE, workers=None,
+          threshold=0.5, chunk_size=CHUNK_SIZE, log_every=10):
+    timer = StageTimer()
+    start_all = time.perf_counter()
+
+    start = time.perf_counter()
+    sink = open_sink(output)
+    done = sink.done_paths()
+    paths = [p for p in list_scans(root) if p not in done]
+    timer.add("scan", start)
+    print(f"{len(paths)} images to score ({len(done)} already in {output})")
+    if not paths:
+        sink.close()
+        return {"images": 0, "seconds": 0.0, "stages": timer.seconds}
+
+    workers = workers or os.cpu_count() or 1
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    # Workers start before TensorFlow is imported here; "spawn" keeps them free of it
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    pending = deque()
+    next_chunk = 0
+
+    def fill():
+        nonlocal next_chunk
+        while next_chunk < len(chunks) and len(pending) < workers * 2:
+            pending.append(pool.submit(_decode_chunk, chunks[next_chunk]))
+            next_chunk += 1
+
+    fill()
+    start = time.perf_counter()
+    if model_path.endswith('.tflite'):
+        # A quantized export from quantize_model.py
+        from quantize_model import TFLiteModel
+        model = TFLiteModel(model_path)
+    else:
+        from tensorflow.keras.models import load_model
+        model = load_model(model_path, compile=False)
+    timer.add("load_model", start)
+
+    batch = np.empty((batch_size, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+    scale = np.float32(1.0 / 255)
+    buffered = []  # (path, uint8 image or None, error)
+    scored = batches = 0
+
+    def run_batch(items):
+        nonlocal scored, batches
+        start = time.perf_counter()
+        good = [i for i, (_, image, _) in enumerate(items) if image is not None]
+        for slot, i in enumerate(good):
+            np.multiply(items[i][1], scale, out=batch[slot])
+        timer.add("preprocess", start)
+        start = time.perf_counter()
+        probabilities = np.asarray(model.predict_on_batch(batch[:len(good)])).reshape(-1) if good else []
+        timer.add("inference", start)
+        start = time.perf_counter()
+        by_index = dict(zip(good, probabilities))
+        rows = []
+        for i, (path, _, error) in enumerate(items):
+            p = by_index.get(i)
+            rows.append({"path": path, "probability": None if p is None else float(p),
+                         "label": None if p is None else _label(p, threshold), "error": error})
+        sink.write(rows)
+        timer.add("write", start)
+        scored += len(items)
+        batches += 1
+        if log_every and batches % log_every == 0:
+            elapsed = time.perf_counter() - start_all
+            print(f"  {scored}/{len(paths)} images, {scored / elapsed:.1f} images/sec")
+
+    try:
+        while pending:
+            start = time.perf_counter()
+            chunk_paths, images, errors = pending.popleft().result()
+            timer.add("decode_wait", start)
+            fill()
+            for path, image, error in zip(chunk_paths, images, errors):
+                buffered.append((path, image if error is None else None, error))
+            while len(buffered) >= batch_size:
+                run_batch(buffered[:batch_size])
+                del buffered[:batch_size]
+        if buffered:
+            run_batch(buffered)
+    finally:
+        pool.shutdown(cancel_futures=True)
+        sink.close()
+    elapsed = time.perf_counter() - start_all
+    scoring = elapsed - timer.seconds["load_model"]
+    return {"images": scored, "seconds": elapsed, "images_per_sec": scored / elapsed,
+            "scoring_images_per_sec": scored / scoring if scoring > 0 else 0.0, "stages": timer.seconds}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a directory tree of scans with the brain CNN")
+    parser.add_argument('root', help="directory searched recursively for images")
+    parser.add_argument('--output', default='scores.csv', help="results file (.csv or .parquet)")
+    parser.add_argument('--model', default=BRAIN_MODEL_PATH, help=".h5 model or quantized .tflite export")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=None, help="decode processes (default: all cores)")
+    parser.add_argument('--threshold', type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    result = score(args.root, args.output, args.model, args.batch_size, args.workers, args.threshold)
+    if result["images"]:
+        print(f"Scored {result['images']} images in {result['seconds']:.1f}s "
+              f"({result['images_per_sec']:.1f} images/sec, "
+              f"{result['scoring_images_per_sec']:.1f} images/sec excluding model load)")
+    total = sum(result["stages"].values()) or 1.0
+    for stage, seconds in result["stages"].items():
+        print(f"  {stage:<12} {seconds:8.2f}s  {100 * seconds / total:5.1f}%")
+
+
+if __name__ == '__main__':
+    main()
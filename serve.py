@@ -0,0 +1,139 @@
+# ----------------------------
+# serve.py – Pre-Forked Multi-Process Server for the Flask API
+# ----------------------------
+# Runs the Flask app from serving.ini in several worker processes that share
+# one listening socket. The parent applies the per-worker thread budget,
+# imports the app and loads the preload models once, then forks: workers
+# share those pages copy-on-write (PyTorch weights) or through the page cache
+# (memory-mapped TFLite files) instead of each holding a private copy.
+# Models are only loaded, never run, before the fork, so no library thread
+# pool is inherited; each worker warms its models up on first use. Crashed
+# workers are replaced; SIGTERM / Ctrl+C stops them all.
+#
+#   python serve.py [--config serving.ini] [--workers 4] [--port 5000]
+import argparse
+import gc
+import importlib.util
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+import serving_config
+
+# Workers that die sooner than this after starting are restarted with a delay
+MIN_WORKER_LIFETIME = 1.0
+
+
+def load_app(path):
+    spec = importlib.util.spec_from_file_location('served_app', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['served_app'] = module
+    spec.loader.exec_module(module)
+    return module.app
+
+
+# Load (without warming up) the configured models in the parent process
+def preload(names):
+    import model_registry
+    for name in names:
+        registry_name = model_registry.scan_model_name() if name == 'scan' else name
+        if registry_name == 'brain_cnn':
+            # TensorFlow's runtime threads do not survive fork(); every worker loads its own copy
+            print("Not preloading the keras scan model: every worker and scan job process loads its own "
+                  "copy, so its memory is not shared. Export a TFLite model (python quantize_model.py export) "
+                  "to share one copy between them.")
+            continue
+        start = time.perf_counter()
+        model_registry.get(registry_name, warm=False)
+        print(f"Preloaded {registry_name} in {time.perf_counter() - start:.1f}s")
+
+
+def _serve(sock, app, host, port):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    from werkzeug.serving import make_server
+    make_server(host, port, app, threaded=True, fd=sock.fileno()).serve_forever()
+
+
+def _spawn(sock, app, host, port):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _serve(sock, app, host, port)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Flask API from several forked worker processes")
+    parser.add_argument('--config', default=serving_config.CONFIG_PATH or serving_config.DEFAULT_CONFIG_PATH)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--port', type=int, default=None)
+    args = parser.parse_args(argv)
+    if not hasattr(os, 'fork'):
+        sys.exit("serve.py needs fork(); on Windows run the app directly")
+
+    config = serving_config.load_config(args.config)
+    if args.workers:
+        config.set('serving', 'workers', str(args.workers))
+    if args.port:
+        config.set('serving', 'port', str(args.port))
+    budget = serving_config.apply(config)
+    # Scan job processes (executor = process) apply the same file when they import scan_jobs
+    os.environ['SERVING_CONFIG'] = os.path.abspath(args.config)
+    workers = max(1, config.getint('serving', 'workers'))
+    host, port = config.get('serving', 'host'), config.getint('serving', 'port')
+
+    app_path = config.get('serving', 'app')
+    app = load_app(app_path)
+    preload(serving_config.preload_names(config))
+    # Keep the collector from touching (and so un-sharing) everything loaded so far
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.create_server((host, port))
+    children = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        children[_spawn(sock, app, host, port)] = time.monotonic()
+    print(f"Serving {app_path} on http://{host}:{port} with {workers} workers "
+          f"({budget['intra_op']} intra-op / {budget['inter_op']} inter-op threads each)")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if stopping or started is None:
+            continue
+        print(f"Worker {pid} exited (status {status}); starting a new one")
+        if time.monotonic() - started < MIN_WORKER_LIFETIME:
+            time.sleep(MIN_WORKER_LIFETIME)
+        if not stopping:
+            children[_spawn(sock, app, host, port)] = time.monotonic()
+    sock.close()
+
+
+if __name__ == '__main__':
+    main()
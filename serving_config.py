@@ -0,0 +1,113 @@
+# ----------------------------
+# serving_config.py – One Config File for Serving Workers
+# ----------------------------
+# Reads serving.ini (or the file named by SERVING_CONFIG) and applies its
+# per-worker thread budget before TensorFlow, TFLite or PyTorch build their
+# thread pools. Otherwise each library sizes its pools to every core, and
+# several workers on one box oversubscribe the CPU many times over.
+# serve.py always applies it. Other processes only do so when SERVING_CONFIG
+# names the file (model_registry and scan_jobs apply it on import), so
+# training, score_scans.py and benchmarks keep every core. Environment
+# variables that are already set take precedence over the file.
+#   SERVING_CONFIG=serving.ini streamlit run app.py
+import configparser
+import os
+import sys
+
+DEFAULT_CONFIG_PATH = 'serving.ini'
+# Opt-in for processes other than serve.py
+CONFIG_PATH = os.environ.get('SERVING_CONFIG')
+
+DEFAULTS = {
+    'serving': {
+        'app': 'ai chatbot .py',
+        'host': '127.0.0.1',
+        'port': '5000',
+        'workers': '2',
+        'preload': 'scan',
+    },
+    'threads': {
+        # 0 = share the cores evenly between workers
+        'intra_op': '0',
+        'inter_op': '1',
+    },
+    'models': {
+        'scan_backend': 'auto',
+    },
+    'jobs': {
+        'executor': 'process',
+        'workers': '2',
+    },
+}
+
+_applied = None
+
+
+def load_config(path=None):
+    config = configparser.ConfigParser()
+    config.read_dict(DEFAULTS)
+    config.read(path or CONFIG_PATH or DEFAULT_CONFIG_PATH, encoding='utf-8')
+    return config
+
+
+def preload_names(config):
+    return [name.strip() for name in config.get('serving', 'preload').split(',') if name.strip()]
+
+
+# Threads each worker process may use: (intra_op, inter_op)
+def thread_budget(config):
+    intra = config.getint('threads', 'intra_op')
+    if intra <= 0:
+        workers = max(1, config.getint('serving', 'workers'))
+        intra = max(1, (os.cpu_count() or 1) // workers)
+    return intra, max(1, config.getint('threads', 'inter_op'))
+
+
+def apply(config=None):
+    global _applied
+    config = config or load_config()
+    intra, inter = thread_budget(config)
+    env = {
+        # OpenMP / BLAS pools used by NumPy, PyTorch and oneDNN
+        'OMP_NUM_THREADS': intra,
+        'MKL_NUM_THREADS': intra,
+        'OPENBLAS_NUM_THREADS': intra,
+        'TF_NUM_INTRAOP_THREADS': intra,
+        'TF_NUM_INTEROP_THREADS': inter,
+        'TFLITE_THREADS': intra,
+        # The Rust tokenizers pool is not fork-safe and would add cores of its own
+        'TOKENIZERS_PARALLELISM': 'false',
+        'SCAN_MODEL_BACKEND': config.get('models', 'scan_backend'),
+        'SCAN_JOB_EXECUTOR': config.get('jobs', 'executor'),
+        'SCAN_WORKERS': config.getint('jobs', 'workers'),
+    }
+    for name, value in env.items():
+        os.environ.setdefault(name, str(value))
+    intra = int(os.environ['TF_NUM_INTRAOP_THREADS'])
+    inter = int(os.environ['TF_NUM_INTEROP_THREADS'])
+    # Libraries imported before this point are limited through their own APIs
+    if 'tensorflow' in sys.modules:
+        tf = sys.modules['tensorflow']
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(intra)
+            tf.config.threading.set_inter_op_parallelism_threads(inter)
+        except RuntimeError:
+            pass  # the runtime is already initialised; the env vars did not reach it either
+    if 'torch' in sys.modules:
+        torch = sys.modules['torch']
+        torch.set_num_threads(intra)
+        try:
+            torch.set_num_interop_threads(inter)
+        except RuntimeError:
+            pass  # can only be set before the first parallel op
+    _applied = {'intra_op': intra, 'inter_op': inter}
+    return _applied
+
+
+# Apply the config file once per process, if SERVING_CONFIG names one
+def apply_if_configured():
+    if _applied is None and CONFIG_PATH:
+        if not os.path.exists(CONFIG_PATH):
+            raise FileNotFoundError(f"SERVING_CONFIG points to a missing file: {CONFIG_PATH}")
+        apply()
+    return _applied
@@ -0,0 +1,131 @@
+# ----------------------------
+# streaming_chat.py – Streaming gpt2 Replies with Reused KV State
+# ----------------------------
+# A ChatSession keeps the model's past key/values between turns, so each new
+# message only feeds its own tokens through the model instead of re-encoding
+# the whole conversation. Replies are yielded piece by piece as they decode.
+import time
+
+USER_PREFIX = "User:"
+BOT_PREFIX = "Bot:"
+DEFAULT_MAX_NEW_TOKENS = 60
+
+
+class ChatSession:
+    def __init__(self, model_handle, max_new_tokens=DEFAULT_MAX_NEW_TOKENS, temperature=0.8, top_k=50):
+        self.model_handle = model_handle
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_k = top_k
+        self.turns = []
+        self.last_metrics = {}
+        self._reset_state()
+
+    def _reset_state(self):
+        self._past = None
+        self._past_len = 0
+        # The reply's last sampled token, not fed to the model yet, and whether
+        # the next prompt still has to start a new line after it
+        self._pending_ids = []
+        self._pending_newline = True
+        self._model_id = None
+
+    # Conversation text used to rebuild the KV state when it has to be dropped:
+    # the most recent turns that fit, one per line as on the incremental path
+    def _history_ids(self, tokenizer, budget):
+        selected = []
+        used = 0
+        for turn in reversed(self.turns):
+            used += len(tokenizer.encode("\n" + turn))
+            if used > budget:
+                break
+            selected.insert(0, turn)
+        return tokenizer.encode("\n".join(selected)) if selected else []
+
+    # Yield the reply to `message` as text fragments while it is being generated
+    def stream_reply(self, message):
+        import torch
+
+        with self.model_handle.hold() as pipe:
+            model, tokenizer = pipe.model, pipe.tokenizer
+            context_window = model.config.n_positions
+            prompt = f"{USER_PREFIX} {message.strip()}\n{BOT_PREFIX}"
+            separator = "\n" if self.turns and self._pending_newline else ""
+            new_ids = self._pending_ids + tokenizer.encode(separator + prompt)
+
+            # The cached state is only valid for the model instance that produced
+            # it (gpt2 may have been unloaded while idle) and must leave room for the reply
+            if self._model_id != id(model) or self._past_len + len(new_ids) + self.max_new_tokens > context_window:
+                self._reset_state()
+                budget = context_window // 2
+                history_ids = self._history_ids(tokenizer, budget)
+                new_ids = history_ids + tokenizer.encode(("\n" if history_ids else "") + prompt)
+                new_ids = new_ids[-(context_window - self.max_new_tokens):]
+            self._model_id = id(model)
+            self._pending_ids = []
+
+            start = time.perf_counter()
+            first_token_at = None
+            token = None
+            reply_ids = []
+            emitted = ""
+            finished = False
+            input_ids = torch.tensor([new_ids])
+            try:
+                with torch.no_grad():
+                    for _ in range(self.max_new_tokens):
+                        out = model(input_ids=input_ids, past_key_values=self._past, use_cache=True)
+                        self._past = out.past_key_values
+                        self._past_len += input_ids.shape[1]
+                        token = self._next_token(out.logits[0, -1])
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        if token == tokenizer.eos_token_id:
+                            break
+                        reply_ids.append(token)
+                        text = tokenizer.decode(reply_ids)
+                        if "\n" in text:
+                            # End of the bot's line (the token may carry text before the newline)
+                            text = text.split("\n", 1)[0]
+                            if len(text) > len(emitted):
+                                yield text[len(emitted):]
+                            emitted = text
+                            break
+                        # Hold back incomplete multi-byte characters until the next token
+                        if not text.endswith("�") and len(text) > len(emitted):
+                            yield text[len(emitted):]
+                            emitted = text
+                        input_ids = torch.tensor([[token]])
+                finished = True
+            finally:
+                self.turns.append(f"{prompt} {emitted.strip()}")
+                if finished and token is not None:
+                    # The reply's last token (EOS, the newline or the one the token
+                    # budget cut off) was sampled but not fed; it goes first next turn
+                    self._pending_ids = [token]
+                    self._pending_newline = "\n" not in tokenizer.decode([token])
+                else:
+                    # Abandoned mid-reply (e.g. a Streamlit rerun) or failed: the KV
+                    # state no longer matches the turns, so rebuild it next time
+                    self._reset_state()
+
+            elapsed = time.perf_counter() - start
+            self.last_metrics = {
+                "prompt_tokens": len(new_ids),
+                "tokens": len(reply_ids),
+                "ttft_ms": (first_token_at - start) * 1000 if first_token_at else None,
+                "tokens_per_sec": len(reply_ids) / elapsed if elapsed > 0 else 0.0,
+            }
+
+    # Greedy for temperature 0, otherwise top-k sampling
+    def _next_token(self, logits):
+        import torch
+
+        if self.temperature <= 0:
+            return int(torch.argmax(logits))
+        top_logits, top_ids = torch.topk(logits / self.temperature, self.top_k)
+        return int(top_ids[torch.multinomial(torch.softmax(top_logits, dim=-1), 1)])
+
+    # Blocking variant for callers that want the whole reply at once
+    def reply(self, message):
+        return "".join(self.stream_reply(message)).strip()
@@ -0,0 +1,204 @@
+# ----------------------------
+# upload_store.py – Content-Addressed Upload Store
+# ----------------------------
+# Uploaded scans are stored once, under the SHA-256 of their contents:
+#   uploads/objects/ab/cd/abcd...ef
+# so two patients' "scan.jpg" no longer overwrite each other and a blob that
+# is already on disk is never written again, whatever name or extension it
+# was uploaded under. uploads/index.jsonl records which original file name
+# (and so extension) and patient each blob was uploaded for.
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from append_log import PerProcess
+from batch_writer import get_writer
+from result_cache import LRUCache
+
+OBJECTS_DIR = "objects"
+INDEX_FILE = "index.jsonl"
+
+StoredUpload = namedtuple("StoredUpload", ["digest", "path", "created"])
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+# Write-only temporary file that hashes and counts bytes as they arrive and
+# refuses to grow past `limit`, so large bodies never sit in memory
+class HashingSpoolFile:
+    def __init__(self, directory, limit):
+        os.makedirs(directory, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=directory, suffix=".part", delete=False)
+        self.name = self._file.name
+        self.limit = limit
+        self.size = 0
+        self._hash = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            self.discard()
+            raise UploadTooLarge(f"Upload exceeds {self.limit} bytes")
+        self._hash.update(data)
+        return self._file.write(data)
+
+    # Copy a readable stream in fixed-size chunks
+    def write_from(self, stream, chunk_size=64 * 1024):
+        for chunk in iter(lambda: stream.read(chunk_size), b""):
+            self.write(chunk)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    # Finish writing; the file at self.name is complete afterwards
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    # Drop the temporary file (no-op once it has been moved into the store)
+    def discard(self):
+        self.close()
+        if os.path.exists(self.name):
+            os.remove(self.name)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+def blob_path(root, digest):
+    return os.path.join(root, OBJECTS_DIR, digest[:2], digest[2:4], digest)
+
+
+def file_extension(filename):
+    return os.path.splitext(filename or "")[1].lower()
+
+
+class UploadStore:
+    def __init__(self, root="uploads"):
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self._lock = threading.Lock()
+        self._index = None
+        self._by_upload_id = LRUCache(maxsize=1024)
+        os.makedirs(root, exist_ok=True)
+        self._writer = get_writer(self.index_path)
+
+    def _load_index(self):
+        links = set()
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    links.add((entry["sha256"], entry.get("patient") or "", entry.get("filename") or ""))
+        return links
+
+    # Path of a blob. Stores written before blobs were keyed on the digest
+    # alone have <digest><ext> files; one of those is renamed on first access.
+    def _blob(self, digest, filename):
+        path = blob_path(self.root, digest)
+        ext = file_extension(filename)
+        if ext and not os.path.exists(path) and os.path.exists(path + ext):
+            try:
+                os.replace(path + ext, path)
+            except FileNotFoundError:
+                pass  # another worker renamed it first
+        return path
+
+    # Write the blob file if it does not exist yet; returns True if it was written
+    def _write_blob(self, data, path):
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        # Atomic rename: concurrent writers of the same blob write identical bytes
+        os.replace(tmp, path)
+        return True
+
+    # Store raw bytes (or a memoryview) uploaded as `filename` for `patient`
+    def put(self, data, filename, patient=None):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob(digest, filename)
+        created = self._write_blob(data, path)
+        self._record(digest, filename, patient, len(data))
+        return StoredUpload(digest, path, created)
+
+    # Move a completed HashingSpoolFile into the store
+    def put_spooled(self, spool, filename, patient=None):
+        spool.close()
+        return self.adopt(spool.name, spool.hexdigest(), spool.size, filename, patient)
+
+    # Move an already hashed temporary file (e.g. a streamed request body) into the store
+    def adopt(self, tmp_path, digest, size, filename, patient=None):
+        path = self._blob(digest, filename)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            created = False
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            created = True
+        self._record(digest, filename, patient, size)
+        return StoredUpload(digest, path, created)
+
+    def _record(self, digest, filename, patient, size):
+        link = (digest, patient or "", filename or "")
+        with self._lock:
+            if self._index is None:
+                self._index = self._load_index()
+            is_new_link = link not in self._index
+            self._index.add(link)
+        if is_new_link:
+            self._writer.write(json.dumps({
+                "sha256": digest,
+                "filename": filename,
+                "patient": patient,
+                "size": size,
+                "uploaded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }, ensure_ascii=False))
+
+    # Streamlit UploadedFile: reruns with the same upload skip hashing entirely
+    def put_uploaded_file(self, uploaded_file, patient=None):
+        upload_id = getattr(uploaded_file, "file_id", None) or getattr(uploaded_file, "id", None)
+        key = (upload_id, patient or "")
+        stored = self._by_upload_id.get(key) if upload_id is not None else None
+        if stored is not None and os.path.exists(stored.path):
+            return stored._replace(created=False)
+        stored = self.put(uploaded_file.getbuffer(), uploaded_file.name, patient)
+        if upload_id is not None:
+            self._by_upload_id.put(key, stored)
+        return stored
+
+    # All index entries recorded for one patient
+    def uploads_for_patient(self, patient):
+        self._writer.flush()
+        entries = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("patient") == patient:
+                        entry["path"] = self._blob(entry["sha256"], entry["filename"])
+                        entries.append(entry)
+        return entries
+
+
+_stores = PerProcess(UploadStore)
+
+
+# One store per upload folder per process, so its caches survive Streamlit reruns
+def get_upload_store(root="uploads"):
+    return _stores.get(os.path.abspath(root), root)
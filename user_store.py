@@ -0,0 +1,81 @@
+# ----------------------------
+# user_store.py – Indexed, Cached User Store
+# ----------------------------
+# Keeps an in-memory dict of the "username<sep>hash" lines in a users file.
+# The index is checked against the file's inode/mtime/size on every lookup
+# and only the bytes appended since the last read are parsed, so lookups are
+# O(1) no matter how many accounts exist. Registrations take an exclusive
+# file lock and re-check the file under it, so several app workers can
+# register users at the same time without duplicates or torn lines.
+import os
+import threading
+
+from append_log import FileTail, PerProcess, file_lock
+
+
+class UserStore:
+    def __init__(self, path, sep=":"):
+        self.path = path
+        self.sep = sep
+        self._lock = threading.Lock()
+        self._users = {}
+        self._tail = FileTail(path)
+
+    # Bring the index up to date with the file; caller holds self._lock
+    def _refresh(self):
+        data, _, restarted = self._tail.read_new()
+        if restarted:
+            self._users = {}
+        for line in data.decode("utf-8").splitlines():
+            username, sep, value = line.strip().partition(self.sep)
+            if sep:
+                # Later lines win, so a user's entry can be updated by appending
+                self._users[username] = value
+
+    def get(self, username):
+        with self._lock:
+            self._refresh()
+            return self._users.get(username)
+
+    def __contains__(self, username):
+        return self.get(username) is not None
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._users)
+
+    def _valid(self, username, value):
+        fields = username + value
+        return bool(username) and self.sep not in username and "\n" not in fields and "\r" not in fields
+
+    def _append(self, username, value, only_if_new):
+        if not self._valid(username, value):
+            return False
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f, file_lock(f):
+                # Another worker may have registered the name since our last read
+                self._refresh()
+                if only_if_new and username in self._users:
+                    return False
+                f.write(f"{username}{self.sep}{value}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._refresh()
+            return True
+
+    # Add a new user; returns False if the name is taken or invalid
+    def add(self, username, value):
+        return self._append(username, value, only_if_new=True)
+
+    # Replace an existing user's stored value (e.g. a re-hashed password)
+    def update(self, username, value):
+        return self._append(username, value, only_if_new=False)
+
+
+_stores = PerProcess(UserStore)
+
+
+# One store per file per process, so the index survives Streamlit reruns
+def get_user_store(path, sep=":"):
+    return _stores.get((os.path.abspath(path), sep), path, sep)